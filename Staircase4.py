@@ -1,47 +1,180 @@
 """measure your JND in orientation using a staircase method"""
-from psychopy import core, visual, gui, data, event
+import time
+launched = time.perf_counter()
+from launch import parseArgs, StartupTimer, remembered, useLastParams
+startup = StartupTimer(launched)
+settings, showDialog = parseArgs()  # --help works before anything heavy is imported
+# the window, stimulus and keyboard modules are imported once the settings are known
+from psychopy import core, data
 from psychopy.tools.filetools import fromFile, toFile
-import numpy, random
-
-try:  # try to get a previous parameters file
-    expInfo = fromFile('lastParams.pickle')
-except:  # if not there then use a default set
-    expInfo = {'observer':'jwp', 'refContrast':1}
+import random
+from trialwriter import TrialWriter
+from scheduler import BlockScheduler, loadBlocks, feedbackText, isReversal
+from columnstore import ColumnBuffer
+from telemetry import Telemetry
+from geometry import monitorLayout, pixelLayout
+from stations import reporterFromEnv
+from livefeed import Publisher, parseAddress, defaultAddress
+import checkpoint, os
+startup.mark('import core/data')
+
+expInfo = {'observer':'jwp', 'refContrast':1}  # the defaults
+if useLastParams():
+    try:  # try to get a previous parameters file
+        expInfo = dict((key, value) for key, value in fromFile('lastParams.pickle').items()
+                       if key in remembered)
+    except:  # if not there then use the defaults
+        pass
+# blockOrder is fixed, random or counterbalanced (by the number in the observer
+# ID, or by orderRow if given); startBlock resumes a session
+expInfo.setdefault('blocks', 'blocks.csv')
+expInfo.setdefault('blockOrder', 'fixed')
+expInfo.setdefault('startBlock', 1)
+# stairMode blocked runs one block at a time, random/fullRandom/sequential interleave them all
+expInfo.setdefault('stairMode', 'blocked')
+# resume carries on the observer's last unfinished session from its checkpoint
+expInfo.setdefault('resume', False)
+# sfDeg sets lambda in cycles/deg from the monitor's calibration; 0 keeps 32 px per lambda
+expInfo.setdefault('monitor', 'testMonitor')
+expInfo.setdefault('sfDeg', 0)
+# every trial is published (never waiting) for dashboard.py to plot
+expInfo.setdefault('publish', defaultAddress)
+expInfo.update(settings)  # from the command line or FLANKER_* environment variables
 expInfo['dateStr'] = data.getDateStr()  # add the current time
-# present a dialogue to change params
-dlg = gui.DlgFromDict(expInfo, title='Contrast Detection JND Exp', fixed=['dateStr'])
-if dlg.OK:
-    toFile('lastParams.pickle', expInfo)  # save params to file for next time
+if showDialog:
+    # present a dialogue to change params
+    from psychopy import gui
+    startup.mark('import gui')
+    dlg = gui.DlgFromDict(expInfo, title='Contrast Detection JND Exp', fixed=['dateStr'])
+    if not dlg.OK:
+        core.quit()  # the user hit cancel so exit
+    startup.mark('dialog')
+if useLastParams():
+    # save params to file for next time, only those meant to carry over to a new session
+    toFile('lastParams.pickle', dict((key, expInfo[key]) for key in remembered if key in expInfo))
+
+if expInfo['resume']:
+    # the staircases, random state and data so far, as at the last completed trial
+    checkpointFile = checkpoint.latest(expInfo['observer'])
+    if checkpointFile is None:
+        raise IOError('there is no checkpoint to resume for %s' % expInfo['observer'])
+    saved = checkpoint.load(checkpointFile, expInfo['observer'])
+    scheduler = saved['scheduler']
+    fileName = checkpointFile[:-len('.ckpt')]
+    keepRows, unwritten = saved['nRows'], saved['unwritten']
+    sessionColumns = saved['columns']
 else:
-    core.quit()  # the user hit cancel so exit
-
-# make a text file to save data
-fileName = expInfo['observer'] + expInfo['dateStr']
-dataFile = open(fileName+'.csv', 'w')  # a simple text file with 'comma-separated-values'
-dataFile.write('FlankerDist,trial,targetSide,oriIncrement,correct\n')
-
-#  Parameters for Gabors
-mySize = 128
-#  0.03125 is 32 pixels per cyccle - lambda = 32
+    # the blocks to run, with every staircase handler built up front
+    scheduler = BlockScheduler(loadBlocks(expInfo['blocks']), order=expInfo['blockOrder'],
+                               observer=expInfo['observer'], startBlock=int(expInfo['startBlock']),
+                               interleave=expInfo['stairMode'], orderRow=expInfo.get('orderRow'))
+    fileName = expInfo['observer'] + expInfo['dateStr']
+    keepRows, unwritten = None, []
+    # every trial again as typed columns, saved to a .npz at the end
+    sessionColumns = ColumnBuffer()
+    checkpointFile = fileName+'.ckpt'
+startup.mark('staircases')
+
+# make a text file to save data, written on a background thread
+dataFile = TrialWriter(fileName+'.csv', ['FlankerDist', 'trial', 'targetSide', 'tilt',
+                                         'oriIncrement', 'correct', 'staircase', 'rt'],
+                       keepRows=keepRows, unwritten=unwritten)
+# how long each phase of every trial took, appended to a sidecar at every block's end
+telemetry = Telemetry(fileName+'_timing.csv')
+# a session started by stations.py reports its progress to the coordinator (otherwise None)
+reporter = reporterFromEnv()
+if reporter is not None:
+    reporter.send('start', observer=expInfo['observer'], fileName=os.path.abspath(fileName),
+                  nBlocks=len(scheduler.blocks))
+publisher = None
+if parseAddress(expInfo['publish']) is not None:
+    publisher = Publisher(expInfo['publish'], observer=expInfo['observer'],
+                          session=os.path.basename(fileName))
+
+#  Parameters for Gabors, in pixels from the geometry in lambdas (see geometry.py);
+#  a flanker distance that doesn't fit on the screen stops here, before the window opens
+lambdaMults = [block['lambdaMult'] for block in scheduler.blocks]
+if expInfo['sfDeg']:
+    layout = monitorLayout(expInfo['monitor'], expInfo['sfDeg'], lambdaMults)
+else:
+    layout = pixelLayout(32, [1440, 900], lambdaMults)
+print(layout.describe())
+mySize = layout.size
+#  the carriers are 128 texels across the patch whatever its size in pixels;
+#  0.03125 is 32 texels per cyccle - 4 lambdas across
+texSize = 128
 theSF = 0.03125
-vOffset = 50
+hOffset = layout.hOffset
+maskerContrast = 0.5
+#  stimulus duration in seconds - rounded to a whole number of frames
+stimDuration = 0.1
+
+from psychopy import visual, event
+from presenter import FramePresenter
+from responses import ResponseCollector
+from flankercache import FlankerCache
+from gaborbank import GaborBank
+startup.mark('import visual/event/keyboard')
 
 # create window and stimuli
-win = visual.Window(size = [1440,900],allowGUI=True, fullscr= True,
-                    monitor='testMonitor', units='pix')
+win = visual.Window(size = layout.windowSize,allowGUI=True, fullscr= True,
+                    monitor=expInfo['monitor'], units='pix')
                     
 
-maskerTL = visual.GratingStim(win, tex='sin', sf=theSF, size=mySize, mask='gauss')
-maskerTR = visual.GratingStim(win, tex='sin', sf=theSF, size=mySize, mask='gauss')
-maskerBL = visual.GratingStim(win, tex='sin', sf=theSF, size=mySize, mask='gauss')
-maskerBR = visual.GratingStim(win, tex='sin', sf=theSF, size=mySize, mask='gauss')
-target = visual.GratingStim(win, tex='sin', sf=theSF, size=mySize, mask='gauss')
+def blockCarrier(block):
+    # blocks may give their own sf (cycles per texel) and ori (deg) for every Gabor
+    return (float(block.get('sf', theSF)), float(block.get('ori', 0)))
+
+# the Gabors of every block, computed once and memory-mapped (shared with other sessions)
+carriers = set(blockCarrier(block) for block in scheduler.blocks)
+gabors = GaborBank(texSize, sfs=sorted(set(sf for sf, ori in carriers)),
+                   oris=sorted(set(ori for sf, ori in carriers)))
+targetCarrier = blockCarrier(scheduler.blocks[0])
+maskerTL = gabors.stim(win, *targetCarrier, size=mySize)
+maskerTR = gabors.stim(win, *targetCarrier, size=mySize)
+maskerBL = gabors.stim(win, *targetCarrier, size=mySize)
+maskerBR = gabors.stim(win, *targetCarrier, size=mySize)
+target = gabors.stim(win, *targetCarrier, size=mySize)
 fixation = visual.GratingStim(win, color=-1, colorSpace='rgb',
                               tex=None, mask='circle', size=0.2)
-                              
-# and some handy clocks to keep track of time
-globalClock = core.Clock()
-trialClock = core.Clock()
+messagetrial = visual.TextStim(win, text='')
+feedback1 = visual.TextStim(win, pos=[0,+3], text='')
+
+# every flanker configuration rendered once, out of the time-critical window
+flankerCache = FlankerCache(win, [maskerTL, maskerTR, maskerBL, maskerBR], hOffset,
+                            fixation=fixation, bank=gabors)
+for block in scheduler.blocks:
+    flankerCache.prebuild([layout.vOffset(block['lambdaMult'])], maskerContrast,
+                          blockCarrier(block))
+startup.mark('window and stimuli')
+
+# the next trial's target side and tilt, chosen ahead of time by prepareTrial()
+nextTrial = {}
+
+def prepareTrial(staircase):
+    # everything the next trial doesn't need a response for; runs while the
+    # participant is still responding to the current one
+    nextTrial['targetSide'] = random.choice([-1,1])  # will be either +1(right) or -1(left)
+    target.setPos([hOffset*nextTrial['targetSide'], 0])  # in other location
+    # orientation mode: tilted clockwise (+1) or anticlockwise (-1) of the reference
+    nextTrial['tilt'] = random.choice([-1,1])
+    if hasattr(staircase, 'prepare'):
+        staircase.prepare()  # e.g. Psi: the next intensity for either answer
+
+def drawArray():
+    # the pre-rendered flankers (and fixation), with the target on top
+    flankers.draw()
+    target.draw()
+
+# measures the refresh period now, before any trial needs it
+presenter = FramePresenter(win, telemetry=telemetry)
+
+# key presses are timed against the stimulus-onset flip
+responses = ResponseCollector(win)
+# the gap from response to next onset is a fixed period, whatever work happens in it
+isi = core.StaticPeriod(screenHz=presenter.frameRate, win=win)
+startup.mark('frame rate')
+print(startup.report())
 
 # display instructions and wait
 #load image
@@ -62,356 +195,125 @@ event.waitKeys()
 
 your_mouse = event.Mouse(visible = False)
 
-##########################
-## BLock 1 - lambda = 3
-#########################
-# All stimuli are vertical in first test
-# Size in pixels!  vOffset is flanker dist
-vOffset = 96
-hOffset = 100
-
-for trialLoop in range(2):
-    formatString = 'Trial %i of 5.' %(trialLoop+1)
-    messagetrial = visual.TextStim(win, pos=[0,+vOffset],text= formatString)
-    messagetrial.draw()
-    win.flip()
-    event.waitKeys()
-    
-    staircase = data.StairHandler(startVal = 0.5,
-                            #  Array as list alters the size of steps - do we want this?
-                          nReversals = 4,
-                          stepType = 'lin', stepSizes = [0.04,0.02,0.01,0.005],
-                          minVal = 0, maxVal = 1,
-                          nUp=1, nDown=3,  # will home in on the 80% threshold
-                          nTrials=10)
-                          
-    for thisIncrement in staircase:  # will continue the staircase until it terminates!
-        # set location of stimuli
-        targetSide= random.choice([-1,1])  # will be either +1(right) or -1(left)
-        maskerTL.setPos([hOffset*targetSide, vOffset])
-        maskerTL.setContrast(0.5)
-        maskerTR.setPos([-hOffset*targetSide, vOffset])
-        maskerTR.setContrast(0.5)
-        maskerBL.setPos([hOffset*targetSide, -vOffset])
-        maskerBL.setContrast(0.5)
-        maskerBR.setPos([-hOffset*targetSide, -vOffset])
-        maskerBR.setContrast(0.5)
-        target.setPos([hOffset*targetSide, 0])  # in other location
-
-        #  setContrast changes contrast!
-        #  thisIncrement will be up or down depending upon thisResp
-        target.setContrast(thisIncrement)
-
-        # draw all stimuli
-        maskerTL.draw()
-        maskerTR.draw()
-        maskerBL.draw()
-        maskerBR.draw()
-        target.draw()
-        fixation.draw()
+# block conditions (flanker distance, staircase settings) are in blocks.csv,
+# lambdaMult is the flanker distance in lambdas, vOffset the same in pixels on this screen;
+# mode orientation blocks (e.g. blocks_orientation.csv) stair the target's tilt instead
+for block, trialLoop, staircase in scheduler.loops():
+    if block is not None:  # interleaved staircases run as one loop, with no block screens
+        formatString = 'Trial %i of %i.' %(trialLoop+1, block['nLoops'])
+        messagetrial.setText(formatString)
+        messagetrial.setPos([0,+layout.vOffset(block['lambdaMult'])])
+        messagetrial.draw()
         win.flip()
+        event.waitKeys()
 
-        # wait 100ms; but use a loop of x frames for more accurate timing
-        core.wait(0.1)
+    prepareTrial(staircase)  # the first trial of the loop has nothing to overlap with
+    for thisIncrement in staircase:  # will continue the staircase until it terminates!
+        # spans are numbered by the trial's row in the data file
+        telemetry.trialN = dataFile.nRows
+        t = telemetry.start()
+        # the block settings of whichever staircase produced this trial
+        condition = staircase.condition
+        vOffset = layout.vOffset(condition['lambdaMult'])
+
+        # location of stimuli, already set by prepareTrial;
+        # the flankers come pre-rendered, only the target is changed per trial
+        targetSide = nextTrial['targetSide']
+        carrier = blockCarrier(condition)
+        flankers = flankerCache.get(vOffset, targetSide, maskerContrast, carrier)
+        if carrier != targetCarrier:  # a new block's Gabor, straight from the bank
+            target.tex = gabors.carrier(*carrier)
+            targetCarrier = carrier
 
-        # blank screen
-        fixation.draw()
-        win.flip()
+        #  thisIncrement will be up or down depending upon thisResp
+        if condition['mode'] == 'orientation':
+            # the staircase drives the tilt away from refOri at a fixed contrast;
+            # ori only changes the target's rotation when drawn, like contrast, no new texture
+            tilt = nextTrial['tilt']
+            target.setContrast(expInfo['refContrast'])
+            target.setOri(condition['refOri'] + tilt*thisIncrement)
+            answer = tilt  # 'right' for clockwise, 'left' for anticlockwise
+        else:
+            #  setContrast changes contrast!
+            tilt = 0
+            target.setContrast(thisIncrement)
+            target.setOri(0)
+            answer = targetSide  # which side the target was on
+        t = telemetry.stop('setup', t)
+
+        # show the array for stimDuration, counted in frames, then blank to fixation;
+        # the response clock starts on the onset flip
+        responses.armOnFlip()
+        presenter.present(drawArray, fixation.draw, stimDuration)
+        t = telemetry.stop('present', t)
+
+        # get response, with its RT from stimulus onset, preparing the next trial meanwhile
+        thisKey, thisRT = responses.waitResponse(whileWaiting=lambda: prepareTrial(staircase))
+        t = telemetry.stop('response', t)
+        if thisKey in ['q', 'escape']:
+            core.quit()  # abort experiment
+        elif thisKey=='left':
+            if answer==-1: thisResp = 1  # correct
+            else: thisResp = -1          # incorrect
+        else:  # 'right'
+            if answer== 1: thisResp = 1  # correct
+            else: thisResp = -1          # incorrect
+        event.clearEvents()  # clear other (eg mouse) events - they clog the buffer
+        if condition['iti']:
+            isi.start(condition['iti'])
 
-        # get response
-        thisResp=None
-        while thisResp==None:
-            allKeys=event.waitKeys()
-            for thisKey in allKeys:
-                if thisKey=='left':
-                    if targetSide==-1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey=='right':
-                    if targetSide== 1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey in ['q', 'escape']:
-                    core.quit()  # abort experiment
-            event.clearEvents()  # clear other (eg mouse) events - they clog the buffer
-    
         # add the data to the staircase so it can calculate the next level
         staircase.addData(thisResp)
-        dataFile.write('3,%i,%i,%.3f,%i\n' %(trialLoop, targetSide, thisIncrement, thisResp))
-        core.wait(1)
-
-    # give some on-screen feedback
-    approxThreshold = numpy.average(staircase.reversalIntensities[-4:])
-    feedback1 = visual.TextStim(
-            win, pos=[0,+3],
-            text='mean of final 6 reversals = %.3f' % (approxThreshold))
-    feedback1.draw()
-    fixation.draw()
-    win.flip()
-    event.waitKeys()  # wait for participant to respond
-
-###########################
-## Block 2 - lambda = 1.5
-###########################
-#  Lambda = 32; 1.5 lambda = 48
-vOffset = 48
-
-for trialLoop in range(2):
-    formatString = 'Trial %i of 5.' %(trialLoop+1)
-    messagetrial = visual.TextStim(win, pos=[0,+vOffset],text= formatString)
-    messagetrial.draw()
-    win.flip()
-    event.waitKeys()
-    
-    # create the staircase handler for 2nd loop
-    staircase2 = data.StairHandler(startVal = 0.5,
-                        stepType = 'lin', stepSizes = [0.04,0.02,0.01,0.005],
-                        #  This is the number of correct responses before stepping down 
-                          #  (nDown) and incorrect for up (nUp)
-                          nReversals = 4,
-                          minVal = 0, maxVal = 1,
-                          nUp=1, nDown=3,  # will home in on the 80% threshold
-                          nTrials=10)
-                          
-    for thisIncrement in staircase2:  # will continue the staircase until it terminates!
-        # set location of stimuli
-        targetSide= random.choice([-1,1])  # will be either +1(right) or -1(left)
-        maskerTL.setPos([hOffset*targetSide, vOffset])
-        maskerTL.setContrast(0.5)
-        maskerTR.setPos([-hOffset*targetSide, vOffset])
-        maskerTR.setContrast(0.5)
-        maskerBL.setPos([hOffset*targetSide, -vOffset])
-        maskerBL.setContrast(0.5)
-        maskerBR.setPos([-hOffset*targetSide, -vOffset])
-        maskerBR.setContrast(0.5)
-        target.setPos([hOffset*targetSide, 0])  # in other location
-
-        #  setContrast changes contrast!
-        #  thisIncrement will be set to +1 or -1, depending on last trial
-        #  Negative values decrease by 0.05, positive increase
-        target.setContrast(thisIncrement)
-
-        # draw all stimuli
-        maskerTL.draw()
-        maskerTR.draw()
-        maskerBL.draw()
-        maskerBR.draw()
-        target.draw()
-        fixation.draw()
-        win.flip()
-
-        # wait 100ms; but use a loop of x frames for more accurate timing
-        core.wait(.1)
-
-        # blank screen
-        fixation.draw()
-        win.flip()
-
-        # get response
-        thisResp=None
-        while thisResp==None:
-            allKeys=event.waitKeys()
-            for thisKey in allKeys:
-                if thisKey=='left':
-                    if targetSide==-1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey=='right':
-                    if targetSide== 1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey in ['q', 'escape']:
-                    core.quit()  # abort experiment
-            event.clearEvents()  # clear other (eg mouse) events - they clog the buffer
-
-        # add the data to the staircase so it can calculate the next level
-        staircase2.addData(thisResp)
-        dataFile.write('1.5,%i,%i,%.3f,%i\n' %(targetSide, trialLoop, thisIncrement, thisResp))
-        
-    # give some on-screen feedback
-    approxThreshold = numpy.average(staircase.reversalIntensities[-4:])
-    feedback1 = visual.TextStim(
-            win, pos=[0,+3],
-            text='mean of final 6 reversals = %.3f' % (approxThreshold))
-    feedback1.draw()
-    fixation.draw()
-    win.flip()
-    event.waitKeys()  # wait for participant to respond
-
-#######################
-## Block 3 - Lambda 6
-#######################
-
-#  Lambda = 32;1.5 lambda = 48
-vOffset = 192
-
-for trialLoop in range(2):
-    formatString = 'Trial %i of 5.' %(trialLoop+1)
-    messagetrial = visual.TextStim(win, pos=[0,+vOffset],text= formatString)
-    messagetrial.draw()
-    win.flip()
-    event.waitKeys()
-    
-    # create the staircase handler for 2nd loop
-    staircase2 = data.StairHandler(startVal = 0.5,
-                        stepType = 'lin', stepSizes = [0.04,0.02,0.01,0.005],
-                        #  This is the number of correct responses before stepping down 
-                          #  (nDown) and incorrect for up (nUp)
-                          nReversals = 4,
-                          minVal = 0, maxVal = 1,
-                          nUp=1, nDown=3,  # will home in on the 80% threshold
-                          nTrials=10)
-                          
-    for thisIncrement in staircase2:  # will continue the staircase until it terminates!
-        # set location of stimuli
-        targetSide= random.choice([-1,1])  # will be either +1(right) or -1(left)
-        maskerTL.setPos([hOffset*targetSide, vOffset])
-        maskerTL.setContrast(0.5)
-        maskerTR.setPos([-hOffset*targetSide, vOffset])
-        maskerTR.setContrast(0.5)
-        maskerBL.setPos([hOffset*targetSide, -vOffset])
-        maskerBL.setContrast(0.5)
-        maskerBR.setPos([-hOffset*targetSide, -vOffset])
-        maskerBR.setContrast(0.5)
-        target.setPos([hOffset*targetSide, 0])  # in other location
-
-        #  setContrast changes contrast!
-        #  thisIncrement will be set to +1 or -1, depending on last trial
-        #  Negative values decrease by 0.05, positive increase
-        target.setContrast(thisIncrement)
-
-        # draw all stimuli
-        maskerTL.draw()
-        maskerTR.draw()
-        maskerBL.draw()
-        maskerBR.draw()
-        target.draw()
-        fixation.draw()
-        win.flip()
-
-        # wait 100ms; but use a loop of x frames for more accurate timing
-        core.wait(.1)
-
-        # blank screen
-        fixation.draw()
-        win.flip()
-
-        # get response
-        thisResp=None
-        while thisResp==None:
-            allKeys=event.waitKeys()
-            for thisKey in allKeys:
-                if thisKey=='left':
-                    if targetSide==-1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey=='right':
-                    if targetSide== 1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey in ['q', 'escape']:
-                    core.quit()  # abort experiment
-            event.clearEvents()  # clear other (eg mouse) events - they clog the buffer
-
-        # add the data to the staircase so it can calculate the next level
-        staircase2.addData(thisResp)
-        dataFile.write('6,%i,%i,%.3f,%i\n' %(targetSide, trialLoop, thisIncrement, thisResp))
-        
-    # give some on-screen feedback
-    approxThreshold = numpy.average(staircase.reversalIntensities[-4:])
-    feedback1 = visual.TextStim(
-            win, pos=[0,+3],
-            text='mean of final 6 reversals = %.3f' % (approxThreshold))
-    feedback1.draw()
-    fixation.draw()
-    win.flip()
-    event.waitKeys()  # wait for participant to respond
-
-##########################
-## Block 4 - Lambda = 12
-##########################
-
-#  Lambda = 32;1.5 lambda = 48
-vOffset = 384
-#  THIS MAY NOT FIT!
-
-for trialLoop in range(2):
-    formatString = 'Trial %i of 5.' %(trialLoop+1)
-    messagetrial = visual.TextStim(win, pos=[0,+vOffset],text= formatString)
-    messagetrial.draw()
-    win.flip()
-    event.waitKeys()
-    
-    # create the staircase handler for 2nd loop
-    staircase2 = data.StairHandler(startVal = 0.5,
-                        stepType = 'lin', stepSizes = [0.04,0.02,0.01,0.005],
-                        #  This is the number of correct responses before stepping down 
-                          #  (nDown) and incorrect for up (nUp)
-                          nReversals = 4,
-                          minVal = 0, maxVal = 1,
-                          nUp=1, nDown=3,  # will home in on the 80% threshold
-                          nTrials=10)
-                          
-    for thisIncrement in staircase2:  # will continue the staircase until it terminates!
-        # set location of stimuli
-        targetSide= random.choice([-1,1])  # will be either +1(right) or -1(left)
-        maskerTL.setPos([hOffset*targetSide, vOffset])
-        maskerTL.setContrast(0.5)
-        maskerTR.setPos([-hOffset*targetSide, vOffset])
-        maskerTR.setContrast(0.5)
-        maskerBL.setPos([hOffset*targetSide, -vOffset])
-        maskerBL.setContrast(0.5)
-        maskerBR.setPos([-hOffset*targetSide, -vOffset])
-        maskerBR.setContrast(0.5)
-        target.setPos([hOffset*targetSide, 0])  # in other location
-
-        #  setContrast changes contrast!
-        #  thisIncrement will be set to +1 or -1, depending on last trial
-        #  Negative values decrease by 0.05, positive increase
-        target.setContrast(thisIncrement)
-
-        # draw all stimuli
-        maskerTL.draw()
-        maskerTR.draw()
-        maskerBL.draw()
-        maskerBR.draw()
-        target.draw()
-        fixation.draw()
-        win.flip()
-
-        # wait 100ms; but use a loop of x frames for more accurate timing
-        core.wait(.1)
-
-        # blank screen
-        fixation.draw()
-        win.flip()
-
-        # get response
-        thisResp=None
-        while thisResp==None:
-            allKeys=event.waitKeys()
-            for thisKey in allKeys:
-                if thisKey=='left':
-                    if targetSide==-1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey=='right':
-                    if targetSide== 1: thisResp = 1  # correct
-                    else: thisResp = -1              # incorrect
-                elif thisKey in ['q', 'escape']:
-                    core.quit()  # abort experiment
-            event.clearEvents()  # clear other (eg mouse) events - they clog the buffer
-
-        # add the data to the staircase so it can calculate the next level
-        staircase2.addData(thisResp)
-        dataFile.write('12,%i,%i,%.3f,%i\n' %(targetSide, trialLoop, thisIncrement, thisResp))
-        
-    # give some on-screen feedback
-    approxThreshold = numpy.average(staircase.reversalIntensities[-4:])
-    feedback1 = visual.TextStim(
-            win, pos=[0,+3],
-            text='mean of final 6 reversals = %.3f' % (approxThreshold))
+        t = telemetry.stop('staircase', t)
+        row = {'FlankerDist': '%g' % condition['lambdaMult'],
+               'trial': condition['trialLoop'], 'targetSide': targetSide, 'tilt': tilt,
+               'oriIncrement': '%.3f' % thisIncrement, 'correct': thisResp,
+               'staircase': condition['label'], 'rt': '%.4f' % thisRT}
+        dataFile.write(row)
+        if reporter is not None:
+            reporter.send('trial', blockN=condition['blockN'], **row)  # only queued
+        reversal = isReversal(staircase)
+        sessionColumns.add(condition['label'], block=condition['blockN'],
+                           loop=condition['trialLoop'], flankerDist=condition['lambdaMult'],
+                           vOffset=vOffset, side=targetSide, tilt=tilt, intensity=thisIncrement,
+                           response=thisResp, rt=thisRT, reversal=reversal)
+        if publisher is not None:
+            publisher.publish('trial', label=condition['label'], blockN=condition['blockN'],
+                              trialLoop=condition['trialLoop'], intensity=float(thisIncrement),
+                              response=thisResp, reversal=reversal)
+        t = telemetry.stop('write', t)
+        # so an abort or crash can resume from here (written during the iti if there is one)
+        checkpoint.save(checkpointFile, scheduler, dataFile.nRows, sessionColumns, expInfo,
+                        dataFile.unwritten())
+        t = telemetry.stop('checkpoint', t)
+        if condition['iti']:
+            isi.complete()  # wait out whatever is left of the iti
+            telemetry.stop('iti', t)
+
+    # make sure everything up to the end of this block is on disk
+    dataFile.sync()
+    telemetry.flush()
+
+    # give some on-screen feedback from this loop's own staircase(s)
+    feedback1.setText(feedbackText(staircase))
     feedback1.draw()
     fixation.draw()
     win.flip()
     event.waitKeys()  # wait for participant to respond
 
 # staircase has ended
+print(presenter.summary())
+telemetry.flush()
+print(telemetry.summary())
 dataFile.close()
-staircase.saveAsPickle(fileName)  # special python binary file to save all the info
+sessionColumns.save(fileName+'.npz')  # typed columns, loadable with columnstore.load
+# special python binary file to save all the info, every staircase of every block
+toFile(fileName+'.psydat', scheduler.staircases)
+os.remove(checkpointFile)  # the session is complete, nothing to resume
+if reporter is not None:
+    reporter.send('end', files=[os.path.abspath(fileName+ext)
+                                for ext in ['.csv', '.npz', '.psydat', '_timing.csv']])
+    reporter.close()
 
 win.close()
 core.quit()
@@ -0,0 +1,71 @@
+"""persistent cache of per-session analysis results, kept beside the session CSVs
+
+Entries are keyed by the SHA-1 of the session file's contents together with
+a key for the analysis (its version and settings), so a renamed or touched
+file still hits and a changed analysis never reuses stale results.  Each entry
+is a small JSON file in a .flankercache directory; reading one marks it as
+recently used, and the least recently used entries are removed whenever the
+cache grows past maxBytes.
+"""
+import hashlib, json, os
+
+cacheDirName = '.flankercache'
+
+
+def fileHash(fileName, blockSize=1 << 16):
+    digest = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for chunk in iter(lambda: f.read(blockSize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settingsKey(*settings):
+    """a short key for anything that changes the results (JSON-serialisable)"""
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class AnalysisCache(object):
+    """Results of an analysis by session file contents, with size-bounded LRU eviction"""
+
+    def __init__(self, directory, analysisKey, maxBytes=64*1024*1024):
+        self.directory = os.path.join(directory, cacheDirName)
+        self.analysisKey = analysisKey
+        self.maxBytes = maxBytes
+        self.hits = self.misses = 0
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, contentHash):
+        return os.path.join(self.directory, '%s-%s.json' % (contentHash, self.analysisKey))
+
+    def get(self, contentHash):
+        """the cached result for a file with this hash, or None"""
+        path = self._path(contentHash)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)  # the mtime is the last use, for evict()
+        self.hits += 1
+        return value
+
+    def put(self, contentHash, value):
+        path = self._path(contentHash)
+        tmpName = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmpName, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmpName, path)
+
+    def evict(self):
+        """remove the least recently used entries until the cache fits in maxBytes"""
+        entries = [(entry.stat(), entry.path) for entry in os.scandir(self.directory)
+                   if entry.name.endswith('.json')]
+        total = sum(stat.st_size for stat, path in entries)
+        for stat, path in sorted(entries, key=lambda entry: entry[0].st_mtime_ns):
+            if total <= self.maxBytes:
+                break
+            os.remove(path)
+            total -= stat.st_size
@@ -0,0 +1,274 @@
+"""thresholds for every session CSV in a directory, one row per observer, mode and flanker distance
+
+Each <observer><dateStr>.csv is streamed row by row.  The trials of every
+staircase loop are replayed through StairHandler's up/down rule (nUp and nDown
+from blocks.csv, with the initial 1-up/1-down rule before the first reversal)
+to find its reversals, and the loop's threshold is the mean of the final
+nLast reversal intensities, as Staircase4.py reports it.  Files are analysed
+in parallel, and their results are cached by content (see analysiscache.py),
+so a rerun only reads sessions that are new or have changed (and with --fit
+only refits if there are any).  Loops run by the Psi method are replayed
+through a PsiHandler instead, and their threshold is its posterior mean.
+
+e.g.  python analyze.py data/ -o thresholds.csv --loops loops.csv
+"""
+import argparse, concurrent.futures, csv, hashlib, os, re
+import numpy
+from analysiscache import AnalysisCache, fileHash, settingsKey
+
+# bump whenever a change here changes the results, so cached ones aren't reused
+analysisVersion = 5
+# psychopy's getDateStr(), in its current and older formats
+datePattern = re.compile(r'(\d{4}-\d{2}-\d{2}_\d{2}h\d{2}\.\d{2}\.\d{3}|\d{4}_[A-Za-z]{3}_\d{2}_\d{4})$')
+loopFields = ['observer', 'dateStr', 'staircase', 'mode', 'FlankerDist', 'trialLoop', 'nTrials',
+              'nReversals', 'threshold']
+summaryFields = ['observer', 'mode', 'FlankerDist', 'nSessions', 'nLoops', 'threshold', 'sd']
+fitFields = ['nTrials', 'alpha', 'beta', 'alphaLo', 'alphaHi', 'converged']
+
+
+def splitName(fileName, extension='.csv'):
+    """(observer, dateStr) from a session file name, or None if it isn't one"""
+    baseName = os.path.basename(fileName)
+    if not baseName.endswith(extension):
+        return None
+    match = datePattern.search(baseName[:-len(extension)])
+    if match is None:
+        return None
+    return baseName[:match.start()], match.group(1)
+
+
+def replayReversals(responses, intensities, nUp=1, nDown=3, applyInitialRule=True):
+    """the reversal intensities StairHandler found for these trials (responses 1 or -1)"""
+    reversals = []
+    counter = lastResp = 0
+    direction = None
+    for resp, intensity in zip(responses, intensities):
+        counter = counter + resp if resp == lastResp else resp
+        lastResp = resp
+        if applyInitialRule and not reversals:
+            goDown, goUp = resp == 1, resp != 1
+        else:
+            goDown = counter >= nDown
+            goUp = counter <= -nUp and not goDown
+        if (goDown and direction == 'up') or (goUp and direction == 'down'):
+            reversals.append(intensity)
+        if goDown or goUp:
+            direction = 'down' if goDown else 'up'
+            counter = 0
+    return reversals
+
+
+def replayPsi(responses, intensities, minVal=0.0, maxVal=1.0):
+    """the threshold estimate a PsiHandler over minVal..maxVal made from these trials"""
+    from psi import PsiHandler
+    psi = PsiHandler(nTrials=len(responses), minVal=minVal, maxVal=maxVal)
+    psi.replay(intensities, responses)
+    return psi.estimate()[0]
+
+
+def readLoops(fileName):
+    """the trials of each staircase loop in a session CSV, in the order they ran
+
+    Returns {(staircase, FlankerDist, trialLoop, mode): (responses, intensities)}, mode
+    being 'orientation' for loops that staired the target's tilt (a nonzero
+    tilt column) and 'contrast' for the rest.
+    Files from the earlier scripts have no staircase column, so their loops
+    are told apart by flanker distance (and the trial column, if any).  In
+    those, every block but the first (FlankerDist 3) wrote its loop number
+    under targetSide and the target side under trial, so it is read from there
+    (fixtures/legacy2015_Mar_03_1200.csv is one such file, and
+    fixtures/legacy_expected.csv the thresholds StairHandler found for it).
+    """
+    loops = {}
+    with open(fileName, newline='') as f:
+        for row in csv.DictReader(f):
+            trialLoop = row.get('trial')
+            if not row.get('staircase') and float(row['FlankerDist']) != 3 and trialLoop is not None:
+                trialLoop = row['targetSide']  # the columns were swapped
+            mode = 'orientation' if int(row.get('tilt') or 0) else 'contrast'
+            key = (row.get('staircase') or row['FlankerDist'], float(row['FlankerDist']),
+                   int(trialLoop or 0), mode)
+            responses, intensities = loops.setdefault(key, ([], []))
+            responses.append(1 if int(row['correct']) == 1 else -1)
+            intensities.append(float(row['oriIncrement']))
+    return loops
+
+
+def analyzeFile(args):
+    """one dict per staircase loop of a session, with the loopFields but observer and dateStr"""
+    fileName, rules, nLast = args
+    results = []
+    for key, (responses, intensities) in readLoops(fileName).items():
+        label, flankerDist, trialLoop, mode = key
+        rule = rules.get(label, rules.get('%g' % flankerDist, {}))
+        if rule.get('method') == 'psi':
+            reversals = []  # the Psi method doesn't step up and down
+            threshold = replayPsi(responses, intensities, rule['minVal'], rule['maxVal'])
+        else:
+            reversals = replayReversals(responses, intensities, rule.get('nUp', 1),
+                                        rule.get('nDown', 3))
+            threshold = numpy.mean(reversals[-nLast:]) if reversals else numpy.nan
+        results.append({'staircase': label, 'mode': mode, 'FlankerDist': flankerDist,
+                        'trialLoop': trialLoop,
+                        'nTrials': len(responses), 'nReversals': len(reversals),
+                        'reversals': reversals, 'threshold': float(threshold),
+                        # every trial too, for the psychometric function fits
+                        'intensities': intensities, 'responses': responses})
+    return {'loops': results}
+
+
+def blockRules(fileName):
+    """nUp/nDown/method per block label (and per flanker distance, for the older files)"""
+    from scheduler import loadBlocks  # psychopy.data, only needed in the main process
+    rules = {}
+    for block in loadBlocks(fileName):
+        rule = {'nUp': int(block['nUp']), 'nDown': int(block['nDown']),
+                'method': block['method'],
+                'minVal': float(block['minVal']), 'maxVal': float(block['maxVal'])}
+        rules[block['label']] = rule
+        rules.setdefault('%g' % block['lambdaMult'], rule)
+    return rules
+
+
+def analyzeDirectory(directory, rules, nLast=4, processes=None, maxCacheBytes=64*1024*1024):
+    """per-loop rows for every session in directory, and how many sessions had to be read
+
+    Results are cached by file contents in a .flankercache directory beside
+    the CSVs, so only new or changed sessions are read again.
+    """
+    cache = AnalysisCache(directory, settingsKey(analysisVersion, rules, nLast), maxCacheBytes)
+    sessions = sorted(entry.path for entry in os.scandir(directory)
+                      if entry.is_file() and splitName(entry.name) is not None)
+    hashes = [fileHash(fileName) for fileName in sessions]
+    results = [cache.get(contentHash) for contentHash in hashes]
+
+    todo = [n for n, result in enumerate(results) if result is None]
+    jobs = [(sessions[n], rules, nLast) for n in todo]
+    if len(jobs) > 1 and processes != 1:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            newResults = list(pool.map(analyzeFile, jobs, chunksize=max(1, len(jobs)//64)))
+    else:
+        newResults = [analyzeFile(job) for job in jobs]
+    for n, result in zip(todo, newResults):
+        results[n] = result
+        cache.put(hashes[n], result)
+    if todo:
+        cache.evict()
+
+    rows = []
+    for fileName, result in zip(sessions, results):
+        # the names come from the file name, not the cache, so a renamed file still hits
+        observer, dateStr = splitName(fileName)
+        for loop in result['loops']:
+            rows.append(dict(loop, observer=observer, dateStr=dateStr))
+    return rows, len(todo)
+
+
+def summarize(loopRows):
+    """one row per observer, mode and flanker distance: the mean (and SD) of its loop thresholds
+
+    Contrast and orientation thresholds are in different units, so each mode
+    has rows of its own.
+    """
+    cells = {}
+    for row in loopRows:
+        cells.setdefault((row['observer'], row['mode'], row['FlankerDist']), []).append(row)
+    summary = []
+    for (observer, mode, flankerDist), rows in sorted(cells.items()):
+        thresholds = numpy.array([row['threshold'] for row in rows], dtype=float)
+        thresholds = thresholds[~numpy.isnan(thresholds)]
+        summary.append({'observer': observer, 'mode': mode, 'FlankerDist': flankerDist,
+                        'nSessions': len(set(row['dateStr'] for row in rows)),
+                        'nLoops': len(thresholds),
+                        'threshold': float(thresholds.mean()) if len(thresholds) else numpy.nan,
+                        'sd': float(thresholds.std(ddof=1)) if len(thresholds) > 1 else numpy.nan})
+    return summary
+
+
+def fitSummary(loopRows, summary, function='weibull', nBoot=0, seed=0, cache=None):
+    """add a psychometric function fit (and bootstrap CI on alpha) to each summary row
+
+    Every trial of an observer in a mode at a flanker distance, from all their
+    sessions and loops, goes into one cell; all the cells are fitted together.  With
+    a cache (an AnalysisCache keyed by the fit settings) the fits are kept
+    under a hash of all those trials, so an unchanged directory is not refitted.
+    """
+    from psychfit import fitCells, bootstrapCells
+    cells = dict(((row['observer'], row['mode'], row['FlankerDist']), n)
+                 for n, row in enumerate(summary))
+    intensity, correct, cell = [], [], []
+    for row in loopRows:
+        intensity.extend(row['intensities'])
+        correct.extend(row['responses'])
+        c = cells[(row['observer'], row['mode'], row['FlankerDist'])]
+        cell.extend([c]*len(row['responses']))
+    # a cell's fit depends on its trials from every session (and its bootstrap
+    # on every other cell's, drawn from the same stream), so the fits are
+    # cached together rather than per session
+    contentHash = None
+    if cache is not None:
+        digest = hashlib.sha1()
+        for values, dtype in ((intensity, float), (correct, int), (cell, int)):
+            digest.update(numpy.asarray(values, dtype=dtype).tobytes())
+            digest.update(b'|')
+        contentHash = digest.hexdigest()
+        fits = cache.get(contentHash)
+        if fits is not None and len(fits) == len(summary):
+            for row, fit in zip(summary, fits):
+                row.update(fit)
+            return summary
+    if nBoot:
+        fit = bootstrapCells(intensity, correct, cell, len(summary), nBoot=nBoot, rng=seed,
+                             function=function)
+    else:
+        fit = fitCells(intensity, correct, cell, len(summary), function=function)
+    fits = []
+    for n, row in enumerate(summary):
+        fits.append({'nTrials': int(fit['nTrials'][n]), 'alpha': float(fit['alpha'][n]),
+                     'beta': float(fit['beta'][n]), 'converged': bool(fit['converged'][n])})
+        if nBoot:
+            fits[-1]['alphaLo'], fits[-1]['alphaHi'] = [float(v) for v in fit['alphaCI'][n]]
+        row.update(fits[-1])
+    if cache is not None:
+        cache.put(contentHash, fits)
+        cache.evict()
+    return summary
+
+
+def writeTable(fileName, fields, rows):
+    with open(fileName, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, lineterminator='\n', extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', default='.')
+    parser.add_argument('-o', '--output', default='thresholds.csv')
+    parser.add_argument('--loops', help='also write the per-loop thresholds to this file')
+    parser.add_argument('--blocks', default='blocks.csv')
+    parser.add_argument('--nLast', type=int, default=4, help='reversals averaged per loop')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--cacheMB', type=float, default=64, help='size limit of the results cache')
+    parser.add_argument('--fit', help='also fit a weibull or logistic function to every cell')
+    parser.add_argument('--boot', type=int, default=0, help='bootstrap replicates for the fit CIs')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    loopRows, nRead = analyzeDirectory(args.directory, blockRules(args.blocks), args.nLast,
+                                       args.processes, int(args.cacheMB*1024*1024))
+    summary = summarize(loopRows)
+    fields = summaryFields
+    if args.fit:
+        fitCache = AnalysisCache(args.directory, settingsKey(analysisVersion, 'fit', args.fit,
+                                                             args.boot, args.seed),
+                                 int(args.cacheMB*1024*1024))
+        summary = fitSummary(loopRows, summary, args.fit, args.boot, args.seed, fitCache)
+        fields = summaryFields + fitFields
+    writeTable(args.output, fields, summary)
+    if args.loops:
+        writeTable(args.loops, loopFields, loopRows)
+    print('%i sessions (%i read), %i loops -> %s'
+          % (len(set((r['observer'], r['dateStr']) for r in loopRows)), nRead, len(loopRows),
+             args.output))
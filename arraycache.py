@@ -0,0 +1,38 @@
+"""numpy arrays computed once, kept on disk and memory-mapped by every later user
+
+The Psi likelihood tables and the Gabor bank are both fixed functions of a
+few settings that are slow to compute and the same in every session, so each
+is saved as a .npy named by a hash of its settings.  Any process that needs
+it again maps the file read-only, and processes on the same machine share
+the pages.
+"""
+import hashlib, os
+import numpy
+
+
+def settingsHash(*settings):
+    """a short hash of the settings: arrays by their values, anything else by its repr"""
+    key = hashlib.sha1()
+    for setting in settings:
+        if isinstance(setting, numpy.ndarray):
+            key.update(numpy.ascontiguousarray(setting, dtype=float).tobytes())
+        else:
+            key.update(repr(setting).encode('utf-8'))
+        key.update(b'|')
+    return key.hexdigest()[:16]
+
+
+def cachedArray(directory, name, compute, *settings):
+    """compute(*settings), loaded memory-mapped from directory if it has been computed before"""
+    fileName = os.path.join(directory, '%s_%s.npy' % (name, settingsHash(*settings)))
+    if os.path.exists(fileName):
+        return numpy.load(fileName, mmap_mode='r')
+    array = compute(*settings)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # write then rename, so a half-written array is never picked up by another process
+    tmpName = '%s.%i.tmp' % (fileName, os.getpid())
+    with open(tmpName, 'wb') as f:
+        numpy.save(f, array)
+    os.replace(tmpName, fileName)
+    return numpy.load(fileName, mmap_mode='r')
@@ -0,0 +1,205 @@
+"""bootstrap confidence intervals for thresholds and the crowding function, on every core
+
+The values resampled are either the final reversals of every loop (method
+'reversals', pooled per observer and flanker distance) or whole loops, i.e. each
+staircase's trial sequence as one unit (method 'loops').  A replicate draws
+each cell's values with replacement and takes their mean as its threshold;
+the crowding function is each observer's threshold at every flanker
+distance over their threshold at the widest one, and the group curve is its mean over
+observers, resampled too.  Contrast and orientation loops are bootstrapped
+separately.
+
+Replicates are split into tasks on a process pool.  Each task gets its own
+child of one numpy SeedSequence, so the results depend on the seed and the
+task size but not on the number of processes or the order tasks finish in.
+Partial CIs are reported as tasks complete.
+
+e.g.  python bootstrap.py data/ -n 10000 -o bootstrap.csv
+"""
+import argparse, concurrent.futures, time, warnings
+import numpy
+
+fields = ['mode', 'observer', 'FlankerDist', 'threshold', 'lo', 'hi', 'crowding', 'crowdingLo',
+          'crowdingHi']
+groupLabel = 'ALL'
+
+
+class Cells(object):
+    """the values to resample, as one flat array with each cell's values contiguous
+
+    Cells are every observer x flanker distance (FlankerDist, in lambdas) of
+    the loops in one mode (contrast and orientation thresholds are in
+    different units, so they are resampled separately);
+    cellIndex[observer, flankerDist] is the flat cell index, -1 where an
+    observer has no data at that distance.
+    """
+
+    def __init__(self, loopRows, method='reversals', nLast=4, mode='contrast'):
+        self.mode = mode
+        pools = {}
+        for row in loopRows:
+            if row['mode'] != mode:
+                continue
+            if method == 'reversals':
+                values = row['reversals'][-nLast:]
+            elif method == 'loops':
+                values = [] if numpy.isnan(row['threshold']) else [row['threshold']]
+            else:
+                raise ValueError("method must be 'reversals' or 'loops'")
+            pools.setdefault((row['observer'], row['FlankerDist']), []).extend(values)
+        pools = dict((key, values) for key, values in pools.items() if values)
+        self.observers = sorted(set(observer for observer, flankerDist in pools))
+        self.flankerDists = sorted(set(flankerDist for observer, flankerDist in pools))
+        self.cellIndex = numpy.full((len(self.observers), len(self.flankerDists)), -1)
+        values, counts = [], []
+        for o, observer in enumerate(self.observers):
+            for v, flankerDist in enumerate(self.flankerDists):
+                if (observer, flankerDist) in pools:
+                    self.cellIndex[o, v] = len(counts)
+                    values.extend(pools[(observer, flankerDist)])
+                    counts.append(len(pools[(observer, flankerDist)]))
+        self.values = numpy.array(values, dtype=float)
+        self.counts = numpy.array(counts)
+        self.starts = numpy.concatenate([[0], numpy.cumsum(self.counts)[:-1]]).astype(int)
+
+    def thresholds(self, rng=None, nRep=None):
+        """(nRep, nCells) resampled thresholds; the plain means if rng is None"""
+        if rng is None:
+            return (numpy.add.reduceat(self.values, self.starts)/self.counts)[None, :]
+        # every replicate draws counts[c] values from cell c's run of values
+        cellOfValue = numpy.repeat(numpy.arange(len(self.counts)), self.counts)
+        picks = self.starts[cellOfValue] + (rng.random((nRep, cellOfValue.size)) *
+                                            self.counts[cellOfValue]).astype(int)
+        return numpy.add.reduceat(self.values[picks], self.starts, axis=1)/self.counts
+
+    def curves(self, thresholds, rng=None):
+        """per replicate: (observer x flanker distance thresholds, crowding, group crowding curve)
+
+        Crowding is each threshold over the observer's threshold at the widest
+        flanker distance; the group curve averages it over observers, resampled with
+        replacement when rng is given.
+        """
+        padded = numpy.concatenate([thresholds, numpy.full((len(thresholds), 1), numpy.nan)], axis=1)
+        grid = padded[:, self.cellIndex]  # (nRep, nObservers, nFlankerDists); -1 picks the NaN
+        crowding = grid/grid[:, :, -1:]
+        sample = crowding
+        if rng is not None:
+            sample = crowding[numpy.arange(len(crowding))[:, None],
+                              rng.integers(0, len(self.observers), (len(crowding), len(self.observers)))]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # a distance nobody was tested at
+            group = numpy.nanmean(sample, axis=1)
+        return grid, crowding, group
+
+
+# the cells, shared by every task in a worker process
+_cells = None
+
+
+def _setCells(cells):
+    global _cells
+    _cells = cells
+
+
+def _task(args):
+    """one task's replicates: (task number, thresholds, crowding, group curve)"""
+    taskN, seed, nRep = args
+    rng = numpy.random.default_rng(seed)
+    thresholds = _cells.thresholds(rng, nRep)
+    grid, crowding, group = _cells.curves(thresholds, rng)
+    return taskN, grid.astype(numpy.float32), crowding.astype(numpy.float32), group
+
+
+def bootstrap(cells, nBoot=10000, seed=0, taskSize=250, processes=None, ci=95):
+    """yields (nDone, results) as tasks finish
+
+    results is a dict of the point estimates (threshold, crowding, group) and
+    the groupCI from the replicates done so far; the last one, with every
+    replicate, has thresholdCI and crowdingCI as well.
+    """
+    seeds = numpy.random.SeedSequence(seed).spawn((nBoot + taskSize - 1)//taskSize)
+    tasks = [(taskN, s, min(taskSize, nBoot - taskN*taskSize)) for taskN, s in enumerate(seeds)]
+    estimate = cells.curves(cells.thresholds())
+    done = [None]*len(tasks)
+    limits = [(100 - ci)/2.0, 100 - (100 - ci)/2.0]
+
+    def results(final):
+        # the partial results only have the group curve's CIs, which are cheap to update
+        finished = [r for r in done if r is not None]
+        summary = {'threshold': estimate[0][0], 'crowding': estimate[1][0], 'group': estimate[2][0]}
+        # in task order, so the final CIs don't depend on which task finished first
+        for name, n in [('threshold', 1), ('crowding', 2), ('group', 3)][0 if final else 2:]:
+            replicates = numpy.concatenate([r[n] for r in finished])
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # cells with no data
+                summary[name + 'CI'] = numpy.nanpercentile(replicates, limits, axis=0)
+        return summary
+
+    if processes == 1:
+        _setCells(cells)
+        for nDone, task in enumerate(tasks, 1):
+            result = _task(task)
+            done[result[0]] = result
+            yield min(nDone*taskSize, nBoot), results(nDone == len(tasks))
+        return
+    with concurrent.futures.ProcessPoolExecutor(processes, initializer=_setCells,
+                                                initargs=(cells,)) as pool:
+        futures = [pool.submit(_task, task) for task in tasks]
+        for nDone, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            result = future.result()
+            done[result[0]] = result
+            yield min(nDone*taskSize, nBoot), results(nDone == len(tasks))
+
+
+def tableRows(cells, summary):
+    rows = []
+    for o, observer in enumerate(cells.observers + [groupLabel]):
+        for v, flankerDist in enumerate(cells.flankerDists):
+            row = {'mode': cells.mode, 'observer': observer, 'FlankerDist': flankerDist}
+            if observer == groupLabel:
+                row.update({'crowding': summary['group'][v], 'crowdingLo': summary['groupCI'][0][v],
+                            'crowdingHi': summary['groupCI'][1][v]})
+            elif cells.cellIndex[o, v] >= 0:
+                row.update({'threshold': summary['threshold'][o, v],
+                            'lo': summary['thresholdCI'][0][o, v],
+                            'hi': summary['thresholdCI'][1][o, v],
+                            'crowding': summary['crowding'][o, v],
+                            'crowdingLo': summary['crowdingCI'][0][o, v],
+                            'crowdingHi': summary['crowdingCI'][1][o, v]})
+            else:
+                continue
+            rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    from analyze import analyzeDirectory, blockRules, writeTable
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', default='.')
+    parser.add_argument('-o', '--output', default='bootstrap.csv')
+    parser.add_argument('-n', '--replicates', type=int, default=10000)
+    parser.add_argument('--method', default='reversals', help='reversals or loops')
+    parser.add_argument('--blocks', default='blocks.csv')
+    parser.add_argument('--nLast', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--taskSize', type=int, default=250)
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    loopRows, nRead = analyzeDirectory(args.directory, blockRules(args.blocks), args.nLast,
+                                       args.processes)
+    rows = []
+    for mode in sorted(set(row['mode'] for row in loopRows)):
+        cells = Cells(loopRows, args.method, args.nLast, mode)
+        t0 = time.time()
+        for nDone, summary in bootstrap(cells, args.replicates, args.seed, args.taskSize,
+                                        args.processes):
+            # the partial group curve, so a long run shows where it's heading
+            print('%s %6i/%i replicates, %5.1f s  group crowding: %s'
+                  % (mode, nDone, args.replicates, time.time() - t0,
+                     '  '.join('%g lambdas %.3f [%.3f, %.3f]' % (flankerDist, summary['group'][v],
+                                                                summary['groupCI'][0][v],
+                                                                summary['groupCI'][1][v])
+                               for v, flankerDist in enumerate(cells.flankerDists))))
+        rows.extend(tableRows(cells, summary))
+    writeTable(args.output, fields, rows)
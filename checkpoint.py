@@ -0,0 +1,54 @@
+"""session checkpoints - everything needed to carry on a session from the last trial
+
+A checkpoint is one pickle holding the scheduler (so every staircase as it
+stands, and the block and loop it had reached), the state of the random
+module, the number of rows the trial writer had taken, those of them that
+were still queued and so might never reach the CSV, and the session's typed
+columns so far.  It is written to a temporary file and renamed over the
+old one, so a crash mid-write leaves the previous checkpoint intact.
+"""
+import glob, os, pickle, random
+
+version = 1
+
+
+def save(fileName, scheduler, nRows, columns=None, expInfo=None, unwritten=()):
+    state = {'version': version, 'scheduler': scheduler, 'random': random.getstate(),
+             'nRows': nRows, 'unwritten': list(unwritten), 'columns': columns,
+             'expInfo': expInfo}
+    tmpName = '%s.%i.tmp' % (fileName, os.getpid())
+    with open(tmpName, 'wb') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpName, fileName)
+
+
+def load(fileName, observer=None):
+    """the checkpoint's contents as a dict; also puts the random module back as it was
+
+    With observer given, a checkpoint of anyone else's session is refused.
+    """
+    with open(fileName, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != version:
+        raise ValueError('%s is a version %s checkpoint, expected %s'
+                         % (fileName, state.get('version'), version))
+    saved = (state.get('expInfo') or {}).get('observer')
+    if observer is not None and saved != observer:
+        raise ValueError('%s is a checkpoint of observer %r, not %r' % (fileName, saved, observer))
+    random.setstate(state['random'])
+    state.setdefault('unwritten', [])
+    return state
+
+
+def latest(observer):
+    """the most recent checkpoint of this observer's sessions, <observer><dateStr>.ckpt, or None
+
+    Only names that are exactly the observer and a date count, so s1 doesn't
+    pick up s12's sessions.
+    """
+    from analyze import splitName
+    fileNames = [fileName for fileName in glob.glob(glob.escape(observer) + '*.ckpt')
+                 if (splitName(fileName, '.ckpt') or [None])[0] == observer]
+    if not fileNames:
+        return None
+    return max(fileNames, key=os.path.getmtime)
@@ -0,0 +1,76 @@
+"""columnar session files - every trial of a session as typed numpy arrays in one .npz
+
+The .npz is written uncompressed, so load() can memory-map each column
+straight out of the zip instead of parsing text or unpickling PsychoPy objects.
+"""
+import struct, zipfile
+import numpy
+from numpy.lib import format as npyformat
+
+# column name and dtype, one value per trial
+columns = [('block', 'i2'),  # position of the block in the session's block order
+           ('loop', 'i2'),  # trialLoop within the block
+           ('staircase', 'i2'),  # index into the staircaseLabels array
+           ('flankerDist', 'f4'),  # in lambdas
+           ('vOffset', 'i2'),  # in pixels
+           ('side', 'i1'),  # targetSide, -1 left or +1 right
+           ('tilt', 'i1'),  # orientation mode: -1 anticlockwise or +1 clockwise, else 0
+           ('intensity', 'f4'),
+           ('response', 'i1'),  # 1 correct, -1 incorrect
+           ('rt', 'f4'),  # seconds, NaN when not measured
+           ('reversal', '?')]
+
+
+class ColumnBuffer(object):
+    """Collects trial values column by column and saves them as one .npz"""
+
+    def __init__(self):
+        self.values = dict((name, []) for name, dtype in columns)
+        self.labels = []
+
+    def add(self, label, rt=numpy.nan, **values):
+        """append one trial; label names its staircase, values are the other columns"""
+        if label not in self.labels:
+            self.labels.append(label)
+        values['staircase'] = self.labels.index(label)
+        values['rt'] = rt
+        for name, dtype in columns:
+            self.values[name].append(values[name])
+
+    def __len__(self):
+        return len(self.values['block'])
+
+    def save(self, fileName):
+        arrays = dict((name, numpy.asarray(self.values[name], dtype=dtype))
+                      for name, dtype in columns)
+        arrays['staircaseLabels'] = numpy.asarray(self.labels, dtype='U')
+        numpy.savez(fileName, **arrays)  # savez never compresses, which load() relies on
+
+
+def load(fileName, mmap=True):
+    """dict of the arrays in a session .npz, memory-mapped read-only if mmap"""
+    if not mmap:
+        with numpy.load(fileName) as npz:
+            return dict((name, npz[name]) for name in npz.files)
+    arrays = {}
+    with zipfile.ZipFile(fileName) as archive, open(fileName, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('%s is compressed and cannot be memory-mapped' % fileName)
+            # the member's data follows its local header, whose extra field can
+            # differ in length from the one in the central directory
+            f.seek(info.header_offset)
+            header = struct.unpack('<4s5HL2L2H', f.read(30))
+            f.seek(header[-2] + header[-1], 1)
+            version = npyformat.read_magic(f)
+            if version == (1, 0):
+                shape, fortranOrder, dtype = npyformat.read_array_header_1_0(f)
+            else:
+                shape, fortranOrder, dtype = npyformat.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if 0 in shape:
+                arrays[name] = numpy.zeros(shape, dtype=dtype)  # mmap can't map no bytes
+            else:
+                arrays[name] = numpy.memmap(fileName, dtype=dtype, mode='r', offset=f.tell(),
+                                            shape=shape, order='F' if fortranOrder else 'C')
+    return arrays
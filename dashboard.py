@@ -0,0 +1,94 @@
+"""live staircase tracks, from the trial events Staircase4.py publishes (see livefeed.py)
+
+One panel per block, with the intensity of every trial of each of its
+staircase loops and the reversals marked, redrawn as the trials arrive.
+Any number of dashboards can watch the same sessions.  Without matplotlib,
+or with --text, every trial is printed as a line instead.
+
+e.g.  python dashboard.py
+      python dashboard.py --address 127.0.0.1:47800 --text
+"""
+import argparse
+from livefeed import Subscriber, defaultAddress
+
+
+class Tracks(object):
+    """Every staircase loop's intensities and reversals, by (observer, label, trialLoop)"""
+
+    def __init__(self):
+        self.tracks = {}
+        self.labels = []  # in the order the blocks were first seen
+
+    def add(self, event):
+        if event.get('event') != 'trial':
+            return None
+        key = (event.get('observer', ''), event['label'], event['trialLoop'])
+        track = self.tracks.setdefault(key, {'intensity': [], 'reversal': []})
+        track['intensity'].append(event['intensity'])
+        track['reversal'].append(event['reversal'])
+        if event['label'] not in self.labels:
+            self.labels.append(event['label'])
+        return key
+
+    def meanReversals(self, key, nReversals=4):
+        """the mean of the loop's final nReversals reversal intensities so far"""
+        track = self.tracks[key]
+        reversals = [i for i, r in zip(track['intensity'], track['reversal']) if r][-nReversals:]
+        return sum(reversals)/len(reversals) if reversals else float('nan')
+
+
+def showText(subscriber, tracks):
+    while True:
+        for event in subscriber.poll(1.0):
+            key = tracks.add(event)
+            if key is not None:
+                print('%s %s loop %i trial %3i: %.3f %s%s  (mean of last 4 reversals %.3f)'
+                      % (key + (len(tracks.tracks[key]['intensity']), event['intensity'],
+                                'correct' if event['response'] == 1 else 'wrong',
+                                ' reversal' if event['reversal'] else '',
+                                tracks.meanReversals(key))))
+
+
+def showPlots(subscriber, tracks, interval=0.25):
+    from matplotlib import pyplot
+    figure = pyplot.figure('staircases')
+    pyplot.show(block=False)
+    while pyplot.fignum_exists(figure.number):
+        new = [tracks.add(event) for event in subscriber.poll()]
+        if [key for key in new if key is not None]:
+            figure.clear()
+            for n, label in enumerate(tracks.labels):
+                axes = figure.add_subplot(len(tracks.labels), 1, n + 1)
+                for (observer, trackLabel, trialLoop), track in sorted(tracks.tracks.items()):
+                    if trackLabel != label:
+                        continue
+                    lines = axes.plot(track['intensity'], '-', label='%s loop %i' % (observer, trialLoop))
+                    reversals = [(i, v) for i, (v, r) in enumerate(zip(track['intensity'],
+                                                                      track['reversal'])) if r]
+                    if reversals:
+                        axes.plot(*zip(*reversals), 'o', color=lines[0].get_color())
+                axes.set_ylabel(label)
+                axes.legend(loc='upper right', fontsize='small')
+            figure.axes[-1].set_xlabel('trial')
+        pyplot.pause(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--address', default=defaultAddress)
+    parser.add_argument('--text', action='store_true', help='print the trials instead of plotting')
+    args = parser.parse_args()
+
+    subscriber = Subscriber(args.address)
+    try:
+        import matplotlib
+    except ImportError:
+        args.text = True
+    try:
+        if args.text:
+            showText(subscriber, Tracks())
+        else:
+            showPlots(subscriber, Tracks())
+    except KeyboardInterrupt:
+        pass
+    subscriber.close()
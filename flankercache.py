@@ -0,0 +1,81 @@
+"""pre-rendered flanker arrays - the four maskers are drawn once into a single image"""
+from collections import OrderedDict
+
+
+def flankerPositions(hOffset, vOffset, targetSide):
+    """the [TL, TR, BL, BR] masker centres in pix, for a target hOffset*targetSide across"""
+    # same layout as the trial loop always used: three patches in the target column
+    return [[hOffset*targetSide, vOffset], [-hOffset*targetSide, vOffset],
+            [hOffset*targetSide, -vOffset], [-hOffset*targetSide, -vOffset]]
+
+
+class FlankerCache(object):
+    """BufferImageStims of the whole flanker configuration, keyed by
+    (vOffset, targetSide, masker contrast bucket, carrier).
+
+    A carrier is an (sf, ori) of the GaborBank given as bank, whose texture
+    the maskers are given before drawing; None keeps their own texture.
+
+    Building an image draws the maskers into the back buffer and captures it,
+    so do that before the time-critical part of a trial (see prebuild).  The
+    least recently used images are evicted once there are more than maxEntries.
+    imageStim makes the images, psychopy's BufferImageStim unless another is
+    given (e.g. offscreen.BufferImageStim, with no GL window).
+    """
+
+    def __init__(self, win, maskers, hOffset, fixation=None,
+                 bucketWidth=0.05, maxEntries=16, bank=None, imageStim=None):
+        if imageStim is None:
+            from psychopy import visual
+            imageStim = visual.BufferImageStim
+        self.imageStim = imageStim
+        self.win = win
+        self.maskers = maskers  # [maskerTL, maskerTR, maskerBL, maskerBR]
+        self.hOffset = hOffset
+        self.fixation = fixation  # baked in too, it never overlaps the target
+        self.bucketWidth = bucketWidth
+        self.maxEntries = maxEntries
+        self.bank = bank
+        self.carrier = None  # the one the maskers have now
+        self.images = OrderedDict()  # most recently used last
+
+    def bucket(self, contrast):
+        return int(round(contrast/self.bucketWidth))
+
+    def build(self, vOffset, targetSide, bucket, carrier=None):
+        """render one configuration into a BufferImageStim"""
+        if carrier is not None and carrier != self.carrier:
+            for masker in self.maskers:
+                masker.tex = self.bank.carrier(*carrier)
+            self.carrier = carrier
+        for masker, pos in zip(self.maskers, flankerPositions(self.hOffset, vOffset, targetSide)):
+            masker.setPos(pos)
+            masker.setContrast(bucket*self.bucketWidth)
+        stims = list(self.maskers)
+        if self.fixation is not None:
+            stims.append(self.fixation)
+        # draws stims to the back buffer, grabs them as one texture, then clears the buffer
+        return self.imageStim(self.win, stim=stims)
+
+    def get(self, vOffset, targetSide, contrast, carrier=None):
+        """the image for this configuration, building it if it isn't cached"""
+        key = (vOffset, targetSide, self.bucket(contrast), carrier)
+        image = self.images.pop(key, None)
+        if image is None:
+            image = self.build(*key)
+            while len(self.images) >= self.maxEntries:
+                self.images.popitem(last=False)  # evict the least recently used
+        self.images[key] = image
+        return image
+
+    def prebuild(self, vOffsets, contrast, carrier=None):
+        """build every (vOffset, targetSide) image for this masker contrast (and carrier)"""
+        for vOffset in vOffsets:
+            for targetSide in [-1, 1]:
+                self.get(vOffset, targetSide, contrast, carrier)
+
+    def evict(self, contrast):
+        """drop every image in this masker contrast bucket"""
+        bucket = self.bucket(contrast)
+        for key in [k for k in self.images if k[2] == bucket]:
+            del self.images[key]
@@ -0,0 +1,90 @@
+"""a bank of Gabor carriers and envelopes, computed once and shared through memory-mapped files
+
+GratingStim(tex='sin', mask='gauss') makes its texture and mask afresh for
+every stimulus.  The bank computes the sine carriers for a whole grid of
+(sf, orientation, phase) with numpy in one go, plus the gaussian envelope,
+and caches both on disk like the Psi tables (see arraycache.py); later banks
+(in this or any other process on the machine) memory-map the same files, so
+they share the pages and a new stimulus is only a texture upload.
+
+A carrier's sf is in cycles per texel.  Stimuli show one texture across the
+patch (their sf is 1/size), so at the default one texel per pixel that is
+cycles per pixel as before; drawn larger or smaller (see geometry.py) the
+carrier scales with the patch.
+Orientations are in degrees clockwise, as psychopy's ori, and phases are in
+cycles, 0 being a sine phase at the stimulus centre.
+"""
+import os
+import numpy
+from arraycache import cachedArray
+
+# where the carrier and envelope arrays are kept between sessions
+cacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gaborcache')
+
+
+def carriers(size, sfs, oris, phases):
+    """(nSf, nOri, nPhase, size, size) float32 sine gratings in -1..1"""
+    # texture rows go up the screen, columns to the right
+    x = numpy.arange(size) - (size - 1)/2.0
+    theta = numpy.radians(numpy.asarray(oris, dtype=float))
+    # clockwise rotation of a vertical grating: it varies along (cos, -sin)
+    along = (numpy.cos(theta)[:, None, None]*x[None, None, :] -
+             numpy.sin(theta)[:, None, None]*x[None, :, None])
+    cycles = (numpy.asarray(sfs, dtype=float)[:, None, None, None, None]*along[None, :, None] +
+              numpy.asarray(phases, dtype=float)[None, None, :, None, None])
+    return numpy.sin(2*numpy.pi*cycles).astype(numpy.float32)
+
+
+def envelope(size, sd=1.0/3):
+    """(size, size) float32 gaussian mask in -1..1, sd as a fraction of the radius as in mask='gauss'"""
+    r = (numpy.arange(size) - (size - 1)/2.0)/(size/2.0)
+    rSquared = r[None, :]**2 + r[:, None]**2
+    return (2*numpy.exp(-rSquared/(2*sd**2)) - 1).astype(numpy.float32)
+
+
+class GaborBank(object):
+    """Carriers for every (sf, ori, phase) in the grid, and one envelope, at size x size texels
+
+    e.g.  bank = GaborBank(128, sfs=[0.03125, 0.0625], oris=[0, 45, 90])
+          target = bank.stim(win, 0.03125, ori=45)
+          target.tex = bank.carrier(0.0625)  # another block's carrier, no recomputing
+    """
+
+    def __init__(self, size=128, sfs=(0.03125,), oris=(0,), phases=(0,), sd=1.0/3):
+        if size < 2 or size & (size - 1):
+            raise ValueError('size must be a power of two, as psychopy textures are')
+        self.size = size
+        self.sfs = [float(sf) for sf in sfs]
+        self.oris = [float(ori) for ori in oris]
+        self.phases = [float(phase) for phase in phases]
+        self.carriers = cachedArray(cacheDir, 'carriers', carriers, size, self.sfs, self.oris,
+                                    self.phases)
+        # a plain ndarray view of the mapped file (no copy): psychopy only takes
+        # a texture or mask as an array if its type is exactly numpy.ndarray
+        self.envelope = numpy.asarray(cachedArray(cacheDir, 'envelope', envelope, size, float(sd)))
+
+    def _index(self, values, value, name):
+        matches = numpy.flatnonzero(numpy.isclose(values, value))
+        if not len(matches):
+            raise ValueError('%s %g is not in the bank (%s)'
+                             % (name, value, ', '.join('%g' % v for v in values)))
+        return matches[0]
+
+    def carrier(self, sf, ori=0, phase=0):
+        """the (size, size) carrier texture, a read-only ndarray view of the shared array"""
+        # an ndarray rather than a memmap, as psychopy's texture type check needs
+        return numpy.asarray(self.carriers[self._index(self.sfs, sf, 'sf'),
+                                           self._index(self.oris, ori, 'ori'),
+                                           self._index(self.phases, phase, 'phase')])
+
+    def stim(self, win, sf, ori=0, phase=0, size=None, **kwargs):
+        """a GratingStim of this carrier under the envelope, size pixels across
+
+        The texture spans the stimulus once, one texel per pixel unless size
+        is given.  Its own ori (and contrast, pos, ...) still apply on top, so
+        rotating the stimulus needs no new texture.
+        """
+        from psychopy import visual
+        size = self.size if size is None else size
+        return visual.GratingStim(win, tex=self.carrier(sf, ori, phase), mask=self.envelope,
+                                  size=size, sf=1.0/size, units='pix', **kwargs)
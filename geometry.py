@@ -0,0 +1,103 @@
+"""flanker geometry in lambdas and degrees of visual angle, converted to pixels for a monitor
+
+The protocol is fixed in wavelengths (lambdas) of the Gabor carrier: the
+patches are sizeLambdas across, the target and flankers are hOffsetLambdas
+either side of fixation, and the flankers of a block are its lambdaMult
+lambdas above and below.  Only lambda itself is set in degrees, as the
+carrier's sf in cycles/deg, and converted to pixels with the monitor's
+calibration (its width and distance in cm and its resolution), the way
+psychopy's deg units do (not corrected for the flat screen).
+
+Every layout is checked against the screen when it is made, so a flanker
+distance that doesn't fit is reported before the window opens, and layouts
+are cached by the calibration they came from.
+
+e.g.  layout = monitorLayout('testMonitor', sfDeg=1.5, lambdaMults=[1.5, 3, 6, 12])
+      layout.size, layout.hOffset, layout.vOffset(12)  # in pixels
+"""
+import math
+
+# 128 px patches, 100 px either side of fixation, at the original 32 px per lambda
+sizeLambdas = 4.0
+hOffsetLambdas = 3.125
+
+# layouts already made, by calibration and protocol
+_layouts = {}
+
+
+class Layout(object):
+    """Pixel sizes and positions of the stimuli at lambdaPix pixels per lambda
+
+    Raises ValueError if a patch at any of the flanker distances (or the
+    target) would be partly off a window of windowSize pixels.
+    """
+
+    def __init__(self, lambdaPix, windowSize, lambdaMults=(), pixPerDeg=None):
+        self.lambdaPix = float(lambdaPix)
+        self.windowSize = [int(windowSize[0]), int(windowSize[1])]
+        self.pixPerDeg = pixPerDeg  # None when lambda was given in pixels
+        self.size = int(round(sizeLambdas*self.lambdaPix))
+        self.hOffset = int(round(hOffsetLambdas*self.lambdaPix))
+        self.vOffsets = dict((float(m), int(round(float(m)*self.lambdaPix))) for m in lambdaMults)
+        self.validate()
+
+    def validate(self):
+        width, height = self.windowSize
+        half = self.size/2.0
+        if self.size < 1:
+            raise ValueError('at %.3g px per lambda the patches are less than a pixel' % self.lambdaPix)
+        if self.hOffset + half > width/2.0:
+            raise ValueError('patches %i px either side of fixation, %i px across, are off the %i px wide screen'
+                             % (self.hOffset, self.size, width))
+        tooFar = [m for m, vOffset in sorted(self.vOffsets.items()) if vOffset + half > height/2.0]
+        if tooFar:
+            raise ValueError('flankers %s lambdas from the target are off the %i px high screen '
+                             '(at most %.2f lambdas fit at %.3g px per lambda)'
+                             % (', '.join('%g' % m for m in tooFar), height,
+                                (height/2.0 - half)/self.lambdaPix, self.lambdaPix))
+
+    def vOffset(self, lambdaMult):
+        """the flanker distance in pixels"""
+        return self.vOffsets[float(lambdaMult)]
+
+    def describe(self):
+        deg = '' if self.pixPerDeg is None else ' (%.2f px/deg, %.3g c/deg)' % (
+            self.pixPerDeg, self.pixPerDeg/self.lambdaPix)
+        return ('%.3g px per lambda%s on %ix%i: patches %i px, hOffset %i px, vOffsets %s px'
+                % (self.lambdaPix, deg, self.windowSize[0], self.windowSize[1], self.size,
+                   self.hOffset, ', '.join('%i' % v for m, v in sorted(self.vOffsets.items()))))
+
+
+def calibration(monitorName):
+    """(width cm, distance cm, [width px, height px]) from psychopy's monitor calibration"""
+    from psychopy import monitors
+    monitor = monitors.Monitor(monitorName)
+    width, distance, sizePix = monitor.getWidth(), monitor.getDistance(), monitor.getSizePix()
+    if not width or not distance or not sizePix:
+        raise ValueError('monitor %r needs its width, distance and size in pixels calibrated'
+                         % monitorName)
+    return float(width), float(distance), [int(sizePix[0]), int(sizePix[1])]
+
+
+def pixPerDeg(width, distance, sizePix):
+    """pixels per degree at the centre of the screen, as psychopy's deg2pix"""
+    return distance*math.pi/180*sizePix[0]/width
+
+
+def monitorLayout(monitorName, sfDeg, lambdaMults=()):
+    """the Layout for a carrier of sfDeg cycles/deg on this monitor, over its whole screen"""
+    width, distance, sizePix = calibration(monitorName)
+    key = ('monitor', width, distance, tuple(sizePix), float(sfDeg),
+           tuple(sorted(float(m) for m in lambdaMults)))
+    if key not in _layouts:
+        perDeg = pixPerDeg(width, distance, sizePix)
+        _layouts[key] = Layout(perDeg/sfDeg, sizePix, lambdaMults, pixPerDeg=perDeg)
+    return _layouts[key]
+
+
+def pixelLayout(lambdaPix=32, windowSize=(1440, 900), lambdaMults=()):
+    """the Layout with lambda given in pixels, as the experiment was first written"""
+    key = ('pixels', float(lambdaPix), tuple(windowSize), tuple(sorted(float(m) for m in lambdaMults)))
+    if key not in _layouts:
+        _layouts[key] = Layout(lambdaPix, windowSize, lambdaMults)
+    return _layouts[key]
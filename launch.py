@@ -0,0 +1,83 @@
+"""session settings from the command line or FLANKER_* environment variables, and startup timing
+
+e.g.  python Staircase4.py --observer p012 --blockOrder counterbalanced --no-dialog
+      FLANKER_OBSERVER=p012 FLANKER_DIALOG=0 python Staircase4.py
+      FLANKER_LASTPARAMS=0 python Staircase4.py   (neither read nor save lastParams.pickle)
+
+Settings given either way override lastParams.pickle (which only keeps the
+remembered fields); the command line wins over the environment.  Without the
+dialog nothing from psychopy.gui (and so no Qt/wx) is imported.
+"""
+import argparse, os, time
+
+# the expInfo keys that can be set, and how to read them from a string
+fields = [('observer', str),
+          ('refContrast', float),
+          ('blocks', str),  # the conditions file, e.g. blocks_orientation.csv
+          ('monitor', str),  # psychopy's calibration of the display
+          ('sfDeg', float),  # lambda in cycles/deg, 0 for the fixed pixel sizes
+          ('publish', str),  # host:port the trial events go to for dashboard.py, or off
+          ('blockOrder', str),  # fixed, random or counterbalanced
+          ('orderRow', int),  # the latin square row when counterbalanced, if not from the ID
+          ('startBlock', int),
+          ('stairMode', str),  # blocked, random, fullRandom or sequential
+          ('resume', lambda s: s.lower() in ['1', 'true', 'yes'])]
+flags = ['resume']  # fields given on the command line as a bare --key, without a value
+# the fields kept in lastParams.pickle for the next session; the others (which
+# blocks, where to start, how to order and interleave them) are for one session
+# only, so a leftover --startBlock 3 can't silently skip the next observer's blocks
+remembered = ['observer', 'refContrast', 'monitor', 'sfDeg', 'publish']
+envPrefix = 'FLANKER_'
+
+
+def parseArgs(argv=None, environ=None):
+    """(settings, showDialog): the expInfo values given, and whether to ask for the rest"""
+    environ = os.environ if environ is None else environ
+    parser = argparse.ArgumentParser(description='flanker orientation staircases')
+    for key, convert in fields:
+        if key == 'resume':
+            parser.add_argument('--resume', action='store_true', default=None,
+                                help="carry on the observer's last unfinished session")
+        else:
+            parser.add_argument('--' + key, type=convert)
+    parser.add_argument('--no-dialog', dest='dialog', action='store_false', default=None,
+                        help='start straight away with these settings')
+    args = parser.parse_args(argv)
+
+    settings = {}
+    for key, convert in fields:
+        value = getattr(args, key)
+        if value is None and envPrefix + key.upper() in environ:
+            value = convert(environ[envPrefix + key.upper()])
+        if value is not None:
+            settings[key] = value
+    showDialog = args.dialog
+    if showDialog is None:
+        showDialog = environ.get(envPrefix + 'DIALOG', '1').lower() not in ['0', 'false', 'no']
+    return settings, showDialog
+
+
+def useLastParams(environ=None):
+    """whether to read and write lastParams.pickle: not when FLANKER_LASTPARAMS is 0
+
+    stations.py turns it off, so that sessions started together neither
+    share one file nor pick up settings from whoever ran the script by hand.
+    """
+    environ = os.environ if environ is None else environ
+    return environ.get(envPrefix + 'LASTPARAMS', '1').lower() not in ['0', 'false', 'no']
+
+
+class StartupTimer(object):
+    """Time from launch to each mark(), printed as one breakdown by report()"""
+
+    def __init__(self, t0=None):
+        self.marks = [('launch', time.perf_counter() if t0 is None else t0)]
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter()))
+
+    def report(self):
+        steps = ['%s %.0f ms' % (label, 1000*(t - self.marks[n][1]))
+                 for n, (label, t) in enumerate(self.marks[1:])]
+        return 'startup %.0f ms: %s' % (1000*(self.marks[-1][1] - self.marks[0][1]),
+                                        ', '.join(steps))
@@ -0,0 +1,90 @@
+"""live trial events - the trial loop publishes every trial as a UDP datagram, viewers subscribe
+
+Publishing is one non-blocking sendto of a short JSON object, to a multicast
+group that stays on this machine (TTL 0) by default, so any number of viewers
+(see dashboard.py) can subscribe and none of them can hold the trial loop up:
+with nobody listening the datagrams are simply dropped, and so is any the
+socket can't take straight away.  A unicast host:port works too, for one
+viewer, e.g. on another machine.
+
+e.g.  python Staircase4.py --publish 239.255.47.80:47800   (the default)
+      python Staircase4.py --publish off
+"""
+import json, select, socket, struct
+
+defaultAddress = '239.255.47.80:47800'
+
+
+def parseAddress(address):
+    """(host, port) from 'host:port', or None for 'off' (or empty)"""
+    if not address or address.lower() in ['off', '0', 'none']:
+        return None
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def isMulticast(host):
+    return 224 <= int(host.split('.')[0]) <= 239
+
+
+class Publisher(object):
+    """Sends events as JSON datagrams without ever waiting"""
+
+    def __init__(self, address=defaultAddress, **fields):
+        self.address = parseAddress(address) if isinstance(address, str) else address
+        self.fields = fields  # sent with every event, e.g. the observer and session
+        self.nDropped = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if isMulticast(self.address[0]):
+            # only to the other processes on this machine
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 0)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                 socket.inet_aton('127.0.0.1'))
+        self.sock.setblocking(False)
+
+    def publish(self, event, **values):
+        values.update(self.fields, event=event)
+        try:
+            self.sock.sendto(json.dumps(values, separators=(',', ':')).encode('utf-8'),
+                             self.address)
+        except OSError:  # buffer full, nobody at a unicast address, no route...
+            self.nDropped += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class Subscriber(object):
+    """Receives the events published to address; poll() returns whatever has arrived"""
+
+    def __init__(self, address=defaultAddress):
+        host, port = parseAddress(address) if isinstance(address, str) else address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # several viewers
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)  # room for bursts
+        if isMulticast(host):
+            self.sock.bind(('', port))
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                 struct.pack('4s4s', socket.inet_aton(host),
+                                             socket.inet_aton('127.0.0.1')))
+        else:
+            self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+    def poll(self, timeout=0.0):
+        """the events received so far, waiting up to timeout s for the first"""
+        events = []
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        while ready:
+            try:
+                datagram = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            try:
+                events.append(json.loads(datagram.decode('utf-8')))
+            except ValueError:
+                pass  # not one of ours
+        return events
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,163 @@
+"""vectorized Monte Carlo evaluation of up/down staircase rules
+
+runStaircases() steps N independent staircases in lockstep as numpy arrays,
+following the same rules as psychopy's StairHandler (including the initial
+1-up/1-down rule before the first reversal), so a staircase design can be
+judged on 100k simulated runs without building a StairHandler for each.
+
+e.g.  python montecarlo.py -n 100000 --threshold 0.3 --slope 3.5
+"""
+import argparse, itertools, time
+import numpy
+from simobserver import SimulatedObserver
+
+START, DOWN, UP = 0, -1, 1
+
+
+def runStaircases(pCorrect, nRuns, startVal, stepSizes, nUp=1, nDown=3, nReversals=4,
+                  nTrials=10, minVal=None, maxVal=None, stepType='lin', nLast=4,
+                  applyInitialRule=True, maxTrials=1000, rng=None):
+    """run nRuns staircases against pCorrect(intensities) -> probabilities
+
+    Returns a dict of arrays, one value per run: threshold (mean of the final
+    nLast reversals, as Staircase4.py reports it), nTrials, nReversals and
+    finished (False if the run hit maxTrials first).
+    """
+    rng = numpy.random.default_rng(rng)
+    stepSizes = numpy.atleast_1d(numpy.asarray(stepSizes, dtype=float))
+    variableStep = len(stepSizes) > 1
+    nReversals = max(nReversals or 0, len(stepSizes))  # as StairHandler enforces
+
+    # state of the runs still going; finished runs are dropped from these arrays
+    # every trial so the later trials only touch the long-running tail
+    ids = numpy.arange(nRuns)
+    intensity = numpy.full(nRuns, float(startVal))
+    step = numpy.full(nRuns, stepSizes[0])
+    counter = numpy.zeros(nRuns, dtype=int)  # +n correct / -n incorrect in a row
+    lastResp = numpy.zeros(nRuns, dtype=int)  # 0 until the first response
+    direction = numpy.full(nRuns, START, dtype=int)
+    nRev = numpy.zeros(nRuns, dtype=int)
+    lastRevs = numpy.full((nRuns, nLast), numpy.nan)  # ring of the final reversals
+
+    threshold = numpy.full(nRuns, numpy.nan)
+    trialsRun = numpy.full(nRuns, maxTrials)
+    reversalsRun = numpy.zeros(nRuns, dtype=int)
+    finishedRuns = numpy.zeros(nRuns, dtype=bool)
+
+    for trialN in range(1, maxTrials + 1):
+        resp = numpy.where(rng.random(ids.size) < pCorrect(intensity), 1, -1)
+        counter = numpy.where(resp == lastResp, counter + resp, resp)
+        lastResp = resp
+
+        # before the first reversal every response moves the staircase
+        initialPhase = (nRev == 0) & applyInitialRule
+        goDown = numpy.where(initialPhase, resp == 1, counter >= nDown)
+        goUp = numpy.where(initialPhase, resp == -1, (counter <= -nUp) & ~goDown)
+        reversal = (goDown & (direction == UP)) | (goUp & (direction == DOWN))
+        direction = numpy.where(goDown, DOWN, numpy.where(goUp, UP, direction))
+
+        revRows = numpy.flatnonzero(reversal)
+        lastRevs[revRows, nRev[revRows] % nLast] = intensity[revRows]
+        nRev += reversal
+        if variableStep and revRows.size:
+            step[revRows] = stepSizes[numpy.minimum(nRev[revRows], len(stepSizes) - 1)]
+
+        if stepType == 'lin':
+            intensity = intensity - step*goDown + step*goUp
+        elif stepType == 'db':
+            intensity = intensity*10.0**((goUp*1.0 - goDown)*step/20.0)
+        elif stepType == 'log':
+            intensity = intensity*10.0**((goUp*1.0 - goDown)*step)
+        else:
+            raise ValueError("stepType must be 'lin', 'db' or 'log'")
+        if minVal is not None or maxVal is not None:
+            intensity = numpy.clip(intensity, minVal, maxVal)
+        counter[goDown | goUp] = 0
+
+        done = nRev >= nReversals
+        if trialN < nTrials or not done.any():
+            continue
+        # record the runs that just finished and keep only the rest
+        doneIds = ids[done]
+        # mean of the final nLast reversals, as Staircase4.py reports it
+        threshold[doneIds] = numpy.nansum(lastRevs[done], axis=1)/numpy.minimum(nRev[done], nLast)
+        trialsRun[doneIds] = trialN
+        reversalsRun[doneIds] = nRev[done]
+        finishedRuns[doneIds] = True
+        keep = ~done
+        ids, intensity, step, counter, lastResp, direction, nRev, lastRevs = [
+            a[keep] for a in (ids, intensity, step, counter, lastResp, direction, nRev, lastRevs)]
+        if not ids.size:
+            break
+
+    if ids.size:  # runs that hit maxTrials still get an estimate, if they reversed at all
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            threshold[ids] = numpy.where(nRev > 0, numpy.nansum(lastRevs, axis=1)/numpy.minimum(nRev, nLast),
+                                         numpy.nan)
+        reversalsRun[ids] = nRev
+    return {'threshold': threshold, 'nTrials': trialsRun, 'nReversals': reversalsRun,
+            'finished': finishedRuns}
+
+
+def convergencePoint(nUp, nDown):
+    """proportion correct that an nUp/nDown staircase converges on
+
+    Where a run of nDown correct is as likely as a run of nUp incorrect to come
+    first (for 1-up/n-down this is 0.5**(1/n), e.g. 79.4% for 1-up/3-down).
+    """
+    lo, hi = 0.0, 1.0
+    for i in range(60):
+        p = (lo + hi)/2
+        q = 1 - p
+        pd, qu = p**(nDown - 1), q**(nUp - 1)
+        pDownFirst = pd*(1 - q**nUp)/(pd + qu - pd*qu)
+        if pDownFirst < 0.5:
+            lo = p
+        else:
+            hi = p
+    return (lo + hi)/2
+
+
+def evaluateDesign(observer, design, nRuns=100000, rng=None, label=None):
+    """bias and variance of the threshold estimate for one staircase design
+
+    design holds the StairHandler settings (startVal, stepSizes, nUp, nDown,
+    nReversals, nTrials, minVal, maxVal); the bias is relative to the
+    observer's true intensity at the design's convergence point.
+    """
+    args = dict((k, design[k]) for k in ['startVal', 'stepSizes', 'nUp', 'nDown', 'nReversals',
+                                         'nTrials', 'minVal', 'maxVal'] if k in design)
+    runs = runStaircases(lambda x: observer.pCorrect(x, label), nRuns, rng=rng, **args)
+    target = observer.intensityFor(convergencePoint(design.get('nUp', 1), design.get('nDown', 3)),
+                                   label)
+    thresholds = runs['threshold'][runs['finished']]
+    return {'target': target, 'mean': numpy.nanmean(thresholds),
+            'bias': numpy.nanmean(thresholds) - target, 'variance': numpy.nanvar(thresholds),
+            'meanTrials': runs['nTrials'].mean(), 'unfinished': (~runs['finished']).mean()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='bias and variance of staircase designs')
+    parser.add_argument('-n', '--runs', type=int, default=100000)
+    parser.add_argument('--function', default='weibull', help='weibull or logistic')
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--slope', type=float, default=3.5)
+    parser.add_argument('--lapse', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    observer = SimulatedObserver(threshold=args.threshold, slope=args.slope,
+                                 function=args.function, lapse=args.lapse)
+    # the blocks.csv design, and variations on its step sizes and rule
+    stepOptions = [[0.04, 0.02, 0.01, 0.005], [0.08, 0.04, 0.02, 0.01], [0.02]]
+    print('%-26s %5s %5s %8s %8s %8s %7s %8s'
+          % ('stepSizes', 'nUp', 'nDown', 'target', 'bias', 'SD', 'trials', 'time'))
+    for stepSizes, nDown in itertools.product(stepOptions, [2, 3, 4]):
+        design = {'startVal': 0.5, 'stepSizes': stepSizes, 'nUp': 1, 'nDown': nDown,
+                  'nReversals': 4, 'nTrials': 10, 'minVal': 0, 'maxVal': 1}
+        t0 = time.time()
+        result = evaluateDesign(observer, design, args.runs, rng=args.seed)
+        print('%-26s %5i %5i %8.4f %+8.4f %8.4f %7.1f %7.0fms'
+              % (' '.join('%g' % s for s in stepSizes), 1, nDown, result['target'],
+                 result['bias'], numpy.sqrt(result['variance']), result['meanTrials'],
+                 1000*(time.time() - t0)))
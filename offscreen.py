@@ -0,0 +1,254 @@
+"""offscreen stand-ins for the psychopy window and stimuli, drawn into numpy arrays
+
+Window, GratingStim and BufferImageStim have the parts of psychopy's
+interface the trial loop uses, so FramePresenter, FlankerCache and the Gabor
+bank's textures run unchanged with no display or GL: stimulus geometry can be
+checked against the frames, and the per-trial draw path timed, on a headless
+machine.  Drawing is a nearest-texel rasterizer in pix units with the origin
+at the centre of the window and y up; colours are psychopy rgb (-1..1) and
+the textures are blended by their mask as alpha.
+
+Flips run on a virtual clock: each one is a refresh after the last, plus a
+refresh for every whole frame period spent drawing since, so a draw path too
+slow for the frame rate shows up as dropped frames.  The CPU time between
+flips is recorded as the render cost of every frame.
+
+e.g.  python offscreen.py --trials 200 --save frame.npy
+"""
+import argparse, math, random, time
+import numpy
+
+# the flanker distances of blocks.csv, in lambdas
+lambdaMults = (1.5, 3, 6, 12)
+
+
+class Window(object):
+    """A (height, width) float32 back and front buffer in place of visual.Window"""
+
+    def __init__(self, size=(1440, 900), color=0.0, units='pix', frameRate=60.0):
+        if units != 'pix':
+            raise ValueError('the offscreen window only draws in pix units')
+        self.size = [int(size[0]), int(size[1])]
+        self.units = units
+        self.color = float(color)
+        self.backBuffer = numpy.full((self.size[1], self.size[0]), self.color, numpy.float32)
+        self.frontBuffer = self.backBuffer.copy()
+        self.frameRate = float(frameRate)
+        self.framePeriod = 1.0/self.frameRate
+        self.refreshThreshold = 1.5*self.framePeriod
+        self.recordFrameIntervals = False
+        self.frameIntervals = []
+        self.renderCosts = []  # seconds of drawing (and anything else) before each flip
+        self.lastFlip = None
+        self.time = 0.0  # the virtual clock
+        self._drawStart = time.perf_counter()
+
+    def getActualFrameRate(self, **kwargs):
+        return self.frameRate
+
+    def flip(self, clearBuffer=True):
+        """show the back buffer at the next refresh the drawing made; returns that time"""
+        cost = time.perf_counter() - self._drawStart
+        self.renderCosts.append(cost)
+        flipTime = self.time + (1 + int(cost//self.framePeriod))*self.framePeriod
+        if self.recordFrameIntervals and self.lastFlip is not None:
+            self.frameIntervals.append(flipTime - self.lastFlip)
+        self.time = self.lastFlip = flipTime
+        self.frontBuffer, self.backBuffer = self.backBuffer, self.frontBuffer
+        if clearBuffer:
+            self.backBuffer.fill(self.color)
+        else:
+            self.backBuffer[...] = self.frontBuffer
+        self._drawStart = time.perf_counter()
+        return flipTime
+
+    def getFrame(self):
+        """the frame on screen now, row 0 at the top as in a screenshot"""
+        return self.frontBuffer.copy()
+
+    def costSummary(self):
+        """one line of render cost percentiles over every flip so far"""
+        if not self.renderCosts:
+            return 'no frames drawn'
+        costs = 1000*numpy.array(self.renderCosts)
+        median, p95, p99 = numpy.percentile(costs, [50, 95, 99])
+        nOver = int((costs > 1000*self.framePeriod).sum())
+        return ('%i frames: render cost median %.3f ms, 95%% %.3f ms, 99%% %.3f ms, max %.3f ms, '
+                '%i over the %.2f ms frame period'
+                % (len(costs), median, p95, p99, costs.max(), nOver, 1000*self.framePeriod))
+
+    def close(self):
+        pass
+
+
+class GratingStim(object):
+    """A texture under a mask, like visual.GratingStim with units='pix'
+
+    tex and mask are arrays in -1..1 (rows going up), as the Gabor bank
+    makes them, or None for a uniform patch; mask may also be 'circle'.
+    One texture spans the stimulus, i.e. sf is taken to be 1/size.
+    """
+
+    def __init__(self, win, tex=None, mask=None, size=128, sf=None, pos=(0, 0), ori=0.0,
+                 contrast=1.0, color=1.0, colorSpace='rgb', opacity=1.0, units='pix'):
+        if isinstance(tex, str) or (isinstance(mask, str) and mask != 'circle'):
+            raise ValueError("offscreen stimuli take array textures and masks (or mask='circle')")
+        self.win = win
+        self.tex = tex
+        self.mask = mask
+        self.size = float(size)
+        self.pos = pos
+        self.ori = ori
+        self.contrast = contrast
+        self.color = float(color)
+        self.opacity = opacity
+        self.rect = None  # the (r0, r1, c0, c1) of the buffer last drawn to
+
+    def setPos(self, pos):
+        self.pos = pos
+
+    def setContrast(self, contrast):
+        self.contrast = contrast
+
+    def setOri(self, ori):
+        self.ori = ori
+
+    def _sample(self, array, s, t):
+        rows = numpy.clip((t*array.shape[0]).astype(int), 0, array.shape[0] - 1)
+        cols = numpy.clip((s*array.shape[1]).astype(int), 0, array.shape[1] - 1)
+        return array[rows, cols]
+
+    def draw(self, win=None):
+        win = self.win if win is None else win
+        width, height = win.size
+        theta = math.radians(self.ori)
+        cos, sin = math.cos(theta), math.sin(theta)
+        half = 0.5*self.size*(abs(cos) + abs(sin))  # of the rotated square's bounding box
+        x, y = float(self.pos[0]), float(self.pos[1])
+        c0 = max(0, int(math.floor(width/2.0 + x - half)))
+        c1 = min(width, int(math.ceil(width/2.0 + x + half)))
+        r0 = max(0, int(math.floor(height/2.0 - y - half)))
+        r1 = min(height, int(math.ceil(height/2.0 - y + half)))
+        self.rect = (r0, r1, c0, c1)
+        if c0 >= c1 or r0 >= r1:
+            return  # entirely off the window
+        # each pixel centre relative to the stimulus, rotated back onto the texture
+        # (psychopy's ori is clockwise)
+        dx = (numpy.arange(c0, c1) + 0.5 - width/2.0 - x)[None, :]
+        dy = (height/2.0 - numpy.arange(r0, r1) - 0.5 - y)[:, None]
+        s = (dx*cos - dy*sin)/self.size + 0.5
+        t = (dx*sin + dy*cos)/self.size + 0.5
+        alpha = ((s >= 0) & (s < 1) & (t >= 0) & (t < 1)).astype(numpy.float32)*self.opacity
+        if isinstance(self.mask, str):  # 'circle'
+            alpha *= (s - 0.5)**2 + (t - 0.5)**2 <= 0.25
+        elif self.mask is not None:
+            alpha *= (self._sample(self.mask, s, t) + 1)/2.0
+        rgb = self.color*self.contrast
+        if self.tex is not None:
+            rgb = rgb*self._sample(self.tex, s, t)
+        region = win.backBuffer[r0:r1, c0:c1]
+        region += alpha*(rgb - region)
+
+
+class BufferImageStim(object):
+    """Stimuli drawn once and captured, like visual.BufferImageStim
+
+    Captures the smallest rect covering them, which is then copied back
+    opaque by every draw().
+    """
+
+    def __init__(self, win, stim=()):
+        self.win = win
+        rects = []
+        for s in stim:
+            s.draw(win)
+            rects.append(s.rect)
+        if rects:
+            self.rect = (min(r[0] for r in rects), max(r[1] for r in rects),
+                         min(r[2] for r in rects), max(r[3] for r in rects))
+        else:
+            self.rect = (0, 0, 0, 0)
+        r0, r1, c0, c1 = self.rect
+        self.image = win.backBuffer[r0:r1, c0:c1].copy()
+        win.backBuffer.fill(win.color)
+
+    def draw(self, win=None):
+        win = self.win if win is None else win
+        r0, r1, c0, c1 = self.rect
+        win.backBuffer[r0:r1, c0:c1] = self.image
+
+
+def stimuli(win, bank, carrier, size=None):
+    """the maskers, target and fixation of Staircase4.py, from the Gabor bank, size px across"""
+    tex = bank.carrier(*carrier)
+    size = bank.size if size is None else size
+    maskers = [GratingStim(win, tex=tex, mask=bank.envelope, size=size) for n in range(4)]
+    target = GratingStim(win, tex=tex, mask=bank.envelope, size=size)
+    fixation = GratingStim(win, color=-1, mask='circle', size=0.2)
+    return maskers, target, fixation
+
+
+def benchmark(strategy='cached', nTrials=200, layout=None, maskerContrast=0.5,
+              stimDuration=0.1, frameRate=60.0, seed=0):
+    """run nTrials through FramePresenter on an offscreen window, drawing the flankers
+    pre-rendered ('cached', as Staircase4.py) or as four Gabors every frame ('direct')
+
+    The stimuli are placed by layout, a geometry.Layout, by default the
+    pixel layout Staircase4.py falls back on with blocks.csv's flanker
+    distances; each trial picks one of them.  Returns the window (with its
+    renderCosts), the presenter, and the last trial's draw function.
+    """
+    from gaborbank import GaborBank
+    from flankercache import FlankerCache, flankerPositions
+    from geometry import pixelLayout
+    from presenter import FramePresenter
+    if layout is None:
+        layout = pixelLayout(lambdaMults=lambdaMults)
+    win = Window(layout.windowSize, frameRate=frameRate)
+    bank = GaborBank(128)
+    maskers, target, fixation = stimuli(win, bank, (bank.sfs[0], bank.oris[0]), layout.size)
+    hOffset = layout.hOffset
+    flankerCache = FlankerCache(win, maskers, hOffset, fixation=fixation, bank=bank,
+                                imageStim=BufferImageStim)
+    presenter = FramePresenter(win)
+    rng = random.Random(seed)
+    vOffsets = [vOffset for m, vOffset in sorted(layout.vOffsets.items())]
+    for trialN in range(nTrials):
+        vOffset, targetSide = rng.choice(vOffsets), rng.choice([-1, 1])
+        target.setPos([hOffset*targetSide, 0])
+        target.setContrast(rng.random())
+        if strategy == 'cached':
+            flankers = flankerCache.get(vOffset, targetSide, maskerContrast)
+            stims = [flankers, target]
+        elif strategy == 'direct':
+            for masker, pos in zip(maskers, flankerPositions(hOffset, vOffset, targetSide)):
+                masker.setPos(pos)
+                masker.setContrast(maskerContrast)
+            stims = maskers + [fixation, target]
+        else:
+            raise ValueError("strategy must be 'cached' or 'direct'")
+
+        def drawArray():
+            for stim in stims:
+                stim.draw()
+        presenter.present(drawArray, fixation.draw, stimDuration)
+    return win, presenter, drawArray
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--strategy', nargs='+', default=['cached', 'direct'])
+    parser.add_argument('--frameRate', type=float, default=60.0)
+    parser.add_argument('--save', help="save the last trial's stimulus frame to this .npy")
+    args = parser.parse_args()
+
+    for strategy in args.strategy:
+        win, presenter, drawArray = benchmark(strategy, args.trials, frameRate=args.frameRate)
+        print('%s: %s' % (strategy, win.costSummary()))
+        print('  %s' % presenter.summary())
+    if args.save:
+        # every trial ends on the blank, so draw the last stimulus once more
+        drawArray()
+        win.flip()
+        numpy.save(args.save, win.getFrame())
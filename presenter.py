@@ -0,0 +1,86 @@
+"""frame-locked stimulus presentation - onset and offset are counted in screen refreshes"""
+from psychopy import logging
+
+
+class FramePresenter(object):
+    """Shows a stimulus for a whole number of frames and keeps a timing record per trial
+
+    With a telemetry.Telemetry, the draw and flip of every frame and every
+    frame interval are recorded as spans too.
+    """
+
+    def __init__(self, win, fallbackRate=60.0, telemetry=None):
+        self.win = win
+        self.telemetry = telemetry
+        # measure the refresh period once at startup rather than trusting the nominal rate
+        frameRate = win.getActualFrameRate(nIdentical=20, nMaxFrames=240,
+                                           nWarmUpFrames=20, threshold=1)
+        if frameRate is None:
+            logging.warning('could not measure the refresh rate, assuming %.1f Hz' % fallbackRate)
+            frameRate = fallbackRate
+        self.frameRate = frameRate
+        self.framePeriod = 1.0/frameRate
+        # a frame interval longer than 1.5 refreshes means at least one frame was dropped
+        win.refreshThreshold = 1.5*self.framePeriod
+        win.recordFrameIntervals = True
+        self.records = []
+        logging.exp('measured refresh rate %.3f Hz (%.3f ms per frame)'
+                    % (frameRate, 1000*self.framePeriod))
+
+    def nFrames(self, duration):
+        """the number of whole refreshes closest to duration (at least one)"""
+        return max(1, int(round(duration/self.framePeriod)))
+
+    def present(self, drawStim, drawBlank, duration):
+        """draw the stimulus on every frame for duration, then flip to the blank screen
+
+        Returns the timing record of this presentation.
+        """
+        nFrames = self.nFrames(duration)
+        flipTimes = []
+        telemetry = self.telemetry
+        for frameN in range(nFrames + 1):
+            if telemetry is not None:
+                t = telemetry.start()
+            if frameN < nFrames:
+                drawStim()  # the back buffer is cleared by every flip so redraw each frame
+            else:
+                drawBlank()
+            if telemetry is not None:
+                t = telemetry.stop('draw', t)
+            flipTimes.append(self.win.flip())
+            if telemetry is not None:
+                telemetry.stop('flip', t)
+
+        # any interval that spans more than one refresh hides dropped frames
+        dropped = 0
+        for frameN in range(nFrames):
+            interval = flipTimes[frameN+1] - flipTimes[frameN]
+            if interval > self.win.refreshThreshold:
+                dropped += int(round(interval/self.framePeriod)) - 1
+            if telemetry is not None:
+                telemetry.record('frameInterval', interval)
+
+        record = {'trial': len(self.records), 'requested': duration,
+                  'nFrames': nFrames, 'achieved': flipTimes[-1] - flipTimes[0],
+                  'dropped': dropped}
+        self.records.append(record)
+        if dropped:
+            logging.warning('trial %i: %i dropped frame(s), stimulus shown for %.1f ms (requested %.1f ms)'
+                            % (record['trial'], dropped, 1000*record['achieved'], 1000*duration))
+        else:
+            logging.exp('trial %i: stimulus shown for %.1f ms (requested %.1f ms)'
+                        % (record['trial'], 1000*record['achieved'], 1000*duration))
+        return record
+
+    def summary(self):
+        """one line describing achieved vs requested durations over all trials"""
+        if not self.records:
+            return 'no stimuli presented'
+        errors = [abs(r['achieved'] - r['requested']) for r in self.records]
+        nDropped = sum(r['dropped'] for r in self.records)
+        nBad = len([r for r in self.records if r['dropped']])
+        return ('%i presentations at %.2f Hz: mean |achieved - requested| = %.2f ms, '
+                'max = %.2f ms, %i dropped frame(s) on %i trial(s)'
+                % (len(self.records), self.frameRate, 1000*sum(errors)/len(errors),
+                   1000*max(errors), nDropped, nBad))
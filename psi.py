@@ -0,0 +1,184 @@
+"""Psi-method threshold estimation (Kontsevich & Tyler, 1999) as a drop-in for StairHandler
+
+Each trial picks, from a grid of candidate intensities, the one that minimises
+the expected entropy of the posterior over (threshold, slope, lapse).  That
+expected entropy only needs two tables per grid -- p(correct) and the binary
+entropy of p(correct) for every (intensity, grid point) -- so both are
+computed once, cached on disk, and memory-mapped by every later handler and
+process.  A trial update is then one row multiply and one matrix-vector product.
+"""
+import os
+import numpy
+from arraycache import cachedArray
+from simobserver import functions
+
+# where the likelihood tables are kept between sessions
+cacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'psicache')
+
+
+def binaryEntropy(p):
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        h = -(p*numpy.log(p) + (1.0 - p)*numpy.log(1.0 - p))
+    return numpy.nan_to_num(h)  # 0*log(0) is 0
+
+
+def _tables(intensities, thresholds, slopes, lapses, function, guess):
+    func = functions[function][0]
+    pCorrect = func(intensities[:, None, None, None], thresholds[None, :, None, None],
+                    slopes[None, None, :, None], guess, lapses[None, None, None, :])
+    pCorrect = pCorrect.reshape(len(intensities), -1)
+    return numpy.concatenate([pCorrect, binaryEntropy(pCorrect)]).astype(numpy.float32)
+
+
+def likelihoodTables(intensities, thresholds, slopes, lapses, function='weibull', guess=0.5):
+    """(2*nIntensities, nGrid) float32 array: p(correct) rows, then its binary entropy
+
+    Loaded memory-mapped from cacheDir when this grid has been computed before.
+    """
+    grids = [numpy.asarray(grid, dtype=float) for grid in (intensities, thresholds, slopes, lapses)]
+    return cachedArray(cacheDir, 'psi', _tables, *(grids + [function, guess]))
+
+
+class PsiHandler(object):
+    """Iterates like a StairHandler: for thisIntensity in psi: ... psi.addData(thisResp)
+
+    Responses are scored as in the trial loop, 1 correct and anything else
+    incorrect.  Runs for exactly nTrials trials; the estimate is the posterior
+    mean of the threshold (for the Weibull, the ~80% correct point in 2AFC).
+    The default grid is 200 thresholds x 50 slopes x 5 lapse rates.
+    """
+
+    def __init__(self, nTrials=40, minVal=0.0, maxVal=1.0, intensities=None,
+                 thresholds=None, slopes=None, lapses=None, function='weibull',
+                 guess=0.5, extraInfo=None, **kwargs):
+        # kwargs swallows StairHandler-only settings (originPath, autoLog...)
+        if intensities is None:
+            intensities = numpy.linspace(minVal, maxVal, 101)
+        if thresholds is None:
+            thresholds = numpy.linspace(minVal + (maxVal - minVal)/200.0, maxVal, 200)
+        if slopes is None:
+            slopes = numpy.geomspace(1.0, 10.0, 50)
+        if lapses is None:
+            lapses = numpy.array([0.0, 0.01, 0.02, 0.04, 0.06])
+        self.intensityGrid = numpy.asarray(intensities, dtype=float)
+        self.thresholds = numpy.asarray(thresholds, dtype=float)
+        self.slopes = numpy.asarray(slopes, dtype=float)
+        self.lapses = numpy.asarray(lapses, dtype=float)
+        self.nTrials = nTrials
+        self.extraInfo = extraInfo
+        self.function = function
+        self.guess = guess
+
+        self.tables = self._loadTables()
+        nGrid = self.tables.shape[1]
+        self.posterior = numpy.full(nGrid, 1.0/nGrid, dtype=numpy.float32)  # flat prior
+
+        self.intensities = []
+        self.data = []
+        self.reversalIntensities = []  # never reverses, kept for StairHandler compatibility
+        self.reversalPoints = []
+        self.thisTrialN = -1
+        self.finished = False
+        self._prepared = None
+        self._nextIndex = self._selectIndex(self.posterior)
+
+    def _loadTables(self):
+        return likelihoodTables(self.intensityGrid, self.thresholds, self.slopes,
+                                self.lapses, self.function, self.guess)
+
+    def __getstate__(self):
+        # the tables are reloaded from the cache rather than pickled with every checkpoint
+        state = self.__dict__.copy()
+        del state['tables']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.tables = self._loadTables()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if len(self.intensities) >= self.nTrials:
+            self.finished = True
+            raise StopIteration
+        self.thisTrialN += 1
+        self._thisIndex = self._nextIndex
+        self.intensities.append(self.intensityGrid[self._thisIndex])
+        return self.intensities[-1]
+
+    next = __next__
+
+    @property
+    def intensity(self):
+        return self.intensityGrid[self._nextIndex]
+
+    def _update(self, correct):
+        pCorrect = self.tables[self._thisIndex]
+        posterior = self.posterior*(pCorrect if correct else 1.0 - pCorrect)
+        return posterior/posterior.sum()
+
+    def prepare(self):
+        """work out the next trial for either response to the current one
+
+        Call it while waiting for the response; addResponse() then only has to
+        pick one of the two.  Before the first trial there is nothing to
+        prepare: its intensity was chosen when the handler was made.
+        """
+        if self.thisTrialN < 0:
+            return
+        self._prepared = {'trialN': self.thisTrialN}
+        for correct in [True, False]:
+            posterior = self._update(correct)
+            self._prepared[correct] = (posterior, self._selectIndex(posterior))
+
+    def addResponse(self, result, intensity=None):
+        self.data.append(result)
+        correct = result == 1
+        if self._prepared is not None and self._prepared['trialN'] == self.thisTrialN:
+            self.posterior, self._nextIndex = self._prepared[correct]
+        else:
+            self.posterior = self._update(correct)
+            self._nextIndex = self._selectIndex(self.posterior)
+        self._prepared = None
+        if len(self.intensities) >= self.nTrials:
+            self.finished = True
+
+    addData = addResponse
+
+    def _selectIndex(self, posterior):
+        """index of the candidate intensity with the least expected posterior entropy
+
+        E[H] = H(posterior) - H(pCorrect) + sum(posterior*binaryEntropy(likelihood)),
+        so one product with the stacked tables gives it for every intensity.
+        """
+        nX = len(self.intensityGrid)
+        both = self.tables.dot(posterior)
+        pCorrect, meanEntropy = both[:nX], both[nX:]
+        return int(numpy.argmin(meanEntropy - binaryEntropy(pCorrect)))
+
+    def replay(self, intensities, responses):
+        """update the posterior with trials already run, e.g. read back from a session file
+
+        Each intensity is taken as the nearest one on the grid; responses are
+        scored as in addResponse().
+        """
+        for intensity, result in zip(intensities, responses):
+            self._thisIndex = int(numpy.argmin(abs(self.intensityGrid - intensity)))
+            self.posterior = self._update(result == 1)
+            self.intensities.append(self.intensityGrid[self._thisIndex])
+            self.data.append(result)
+            self.thisTrialN += 1
+        self._nextIndex = self._selectIndex(self.posterior)
+
+    def marginals(self):
+        """posterior over the threshold, slope and lapse grids"""
+        grid = self.posterior.reshape(len(self.thresholds), len(self.slopes), len(self.lapses))
+        return grid.sum(axis=(1, 2)), grid.sum(axis=(0, 2)), grid.sum(axis=(0, 1))
+
+    def estimate(self):
+        """posterior mean (threshold, slope, lapse)"""
+        pThreshold, pSlope, pLapse = self.marginals()
+        return (float(pThreshold.dot(self.thresholds)), float(pSlope.dot(self.slopes)),
+                float(pLapse.dot(self.lapses)))
@@ -0,0 +1,275 @@
+"""maximum-likelihood psychometric function fits for many cells at once
+
+Every trial of every cell (e.g. each observer x flanker distance) goes into
+one set of flat arrays, with a cell index per trial.  Trials are first pooled
+into binomial counts per cell and intensity (staircase intensities sit on a
+lattice, so this is several times fewer rows).  The cells' likelihoods are
+independent, so all of them are fitted together by Fisher scoring: each cell's
+gradient and 2x2 information matrix come from one pass over the rows
+(numpy.bincount by cell), and every cell takes its own step, with step
+halving, in the same array operation.  Cells drop out of the arrays as they
+converge.  With few trials the likelihood can have more than one peak, so
+each cell starts from its best point at every slope on a grid; the starts
+are fitted side by side as cells of their own until they are near their
+peaks, and the best of each cell's is fitted to the end.  Fitting tens of
+thousands of cells is then a few dozen passes over the data rather than a
+scipy.optimize call per cell.
+
+The parameters are alpha (threshold) and beta (slope), as in simobserver.py,
+fitted as log(alpha) and log(beta); guess and lapse are fixed.
+"""
+import numpy
+import scipy.sparse
+from simobserver import functions
+
+# bounds on log(beta), so cells with (nearly) all correct responses stay finite
+logBetaRange = (numpy.log(0.3), numpy.log(50.0))
+# how near its peak every start is fitted before the best of each cell's is
+# chosen (the log likelihood the remaining steps are expected to gain)
+screenTolerance = 1e-3
+
+
+def _pAndDerivs(x, logAlpha, logBeta, function, guess, lapse, derivs=True):
+    """p(correct) and its derivatives by log(alpha) and log(beta), per row"""
+    alpha, beta = numpy.exp(logAlpha), numpy.exp(logBeta)
+    scale = 1.0 - guess - lapse
+    if function == 'weibull':
+        # u = (x/alpha)**beta, through logs and capped so it can't overflow;
+        # past the cap 1 - exp(-u) is 1 to double precision anyway
+        logU = numpy.minimum(beta*(numpy.log(numpy.maximum(x, 1e-12)) - logAlpha), 6.5)
+        u = numpy.exp(logU)
+        dFdu = numpy.exp(-u)
+        p = guess + scale*(1.0 - dFdu)
+        if not derivs:
+            return p
+        return p, -scale*dFdu*u*beta, scale*dFdu*u*logU
+    elif function == 'logistic':
+        z = numpy.clip(beta*(x - alpha), -700.0, 700.0)
+        f = 1.0/(1.0 + numpy.exp(-z))
+        p = guess + scale*f
+        if not derivs:
+            return p
+        dFdz = f*(1.0 - f)
+        return p, -scale*dFdz*beta*alpha, scale*dFdz*z
+    raise ValueError('function must be one of %s' % ', '.join(sorted(functions)))
+
+
+def _logLik(p, k, n, cell, nCells):
+    p = numpy.clip(p, 1e-12, 1.0 - 1e-12)
+    return numpy.bincount(cell, k*numpy.log(p) + (n - k)*numpy.log(1.0 - p), minlength=nCells)
+
+
+def _pool(x, correct, cell):
+    """trials as binomial counts: (cell, level, nCorrect, nTrials) per row, and the intensity levels"""
+    levels, level = numpy.unique(x, return_inverse=True)
+    keys, row = numpy.unique(cell*len(levels) + level.ravel(), return_inverse=True)
+    k = numpy.bincount(row, correct, minlength=len(keys))
+    n = numpy.bincount(row, minlength=len(keys)).astype(float)
+    return keys//len(levels), keys % len(levels), k, n, levels
+
+
+def _gridStart(level, levels, k, n, cell, nCells, function, guess, lapse):
+    """the best (log alpha, log beta) of each cell at every slope on a grid, and its log likelihood
+
+    Returns (2, nCells, nSlopes) and (nCells, nSlopes) arrays.
+    """
+    # alphas at every intensity tested (at quantiles of them, if there are
+    # many), and steep slopes too: with few trials the likelihood can have
+    # several peaks, and only a fine enough start finds the highest
+    positive = levels > 0
+    if positive.any():
+        alphas = levels[positive]
+        if len(alphas) > 40:
+            weights = numpy.cumsum(numpy.bincount(level, n, minlength=len(levels))[positive])
+            picks = numpy.searchsorted(weights/weights[-1], numpy.linspace(0.01, 0.99, 40))
+            # the lowest and highest too, where a cell far from the rest has its peak
+            alphas = numpy.unique(numpy.concatenate([alphas[[0, -1]],
+                                                     alphas[numpy.minimum(picks, len(alphas) - 1)]]))
+        alphas = numpy.log(alphas)
+        # and halfway between them, where a steep function's peak is (between two levels)
+        alphas = numpy.sort(numpy.concatenate([alphas, (alphas[1:] + alphas[:-1])/2.0]))
+    else:
+        alphas = numpy.log(numpy.geomspace(1e-3, 1.0, 40))
+    betas = numpy.log([0.5, 1.0, 2.0, 3.5, 6.0, 12.0, 25.0, 50.0])
+
+    # each cell's log likelihood at every grid point is its (nCorrect, nWrong)
+    # counts per intensity level times log p and log(1 - p) at that level,
+    # so the whole grid is two sparse matrix products
+    right = scipy.sparse.csr_matrix((k, (cell, level)), shape=(nCells, len(levels)))
+    wrong = scipy.sparse.csr_matrix((n - k, (cell, level)), shape=(nCells, len(levels)))
+    # the best alpha at each slope: peaks of the likelihood differ mostly in
+    # slope (a step between two intensities, or a gentle rise from below the
+    # lowest), so each of these is a start
+    best = numpy.empty((nCells, len(betas)))
+    start = numpy.empty((2, nCells, len(betas)))
+    for j, logBeta in enumerate(betas):  # a slope at a time, to bound the memory used
+        p = numpy.clip(_pAndDerivs(levels[:, None], alphas[None, :], logBeta, function, guess,
+                                   lapse, False), 1e-12, 1.0 - 1e-12)
+        ll = right.dot(numpy.log(p)) + wrong.dot(numpy.log(1.0 - p))
+        pick = ll.argmax(axis=1)
+        best[:, j] = ll[numpy.arange(nCells), pick]
+        start[0, :, j], start[1, :, j] = alphas[pick], logBeta
+    return start, best
+
+
+def _score(x, k, n, cell, theta, ll, function, guess, lapse, logAlphaRange, maxIter, tolerance):
+    """Fisher scoring of every cell from theta (2, nCells), in place; returns converged per cell"""
+    nCells = len(ll)
+    converged = numpy.zeros(nCells, dtype=bool)
+    # only the rows of cells still converging are worked on; ids are the
+    # cells those rows belong to, and cell their index among them
+    ids = numpy.arange(nCells)
+    for iteration in range(maxIter):
+        nActive = ids.size
+        th, llActive = theta[:, ids], ll[ids]
+        p, dA, dB = _pAndDerivs(x, th[0][cell], th[1][cell], function, guess, lapse)
+        p = numpy.clip(p, 1e-9, 1.0 - 1e-9)
+        w = 1.0/(p*(1.0 - p))
+        resid = (k - n*p)*w
+        gA = numpy.bincount(cell, resid*dA, minlength=nActive)
+        gB = numpy.bincount(cell, resid*dB, minlength=nActive)
+        nw = n*w
+        iAA = numpy.bincount(cell, nw*dA*dA, minlength=nActive)
+        iAB = numpy.bincount(cell, nw*dA*dB, minlength=nActive)
+        iBB = numpy.bincount(cell, nw*dB*dB, minlength=nActive)
+        # the scoring step, solving each cell's 2x2 system directly (ridged so it's never singular)
+        ridge = 1e-6*(iAA + iBB) + 1e-12
+        det = (iAA + ridge)*(iBB + ridge) - iAB*iAB
+        step = numpy.array([((iBB + ridge)*gA - iAB*gB)/det, ((iAA + ridge)*gB - iAB*gA)/det])
+        # a cell whose beta is at a bound and being pushed past it only moves alpha
+        pinned = (((th[1] >= logBetaRange[1]) & (step[1] > 0)) |
+                  ((th[1] <= logBetaRange[0]) & (step[1] < 0)))
+        step[0, pinned] = gA[pinned]/(iAA[pinned] + ridge[pinned])
+        step[1, pinned] = 0.0
+        # no further than a factor of e in alpha or beta at once: far from a
+        # peak (e.g. a steep start on a plateau) the full step is a wild overshoot
+        step /= numpy.maximum(1.0, numpy.abs(step).max(axis=0))
+        # the expected gain of the step (the Newton decrement, unless it was capped)
+        decrement = gA*step[0] + gB*step[1]
+
+        # halve the step of each cell whose likelihood fell, re-evaluating only those cells
+        scale = numpy.ones(nActive)
+        trial = th + step
+        halve = numpy.ones(nActive, dtype=bool)
+        llTrial = numpy.empty(nActive)
+        rows = numpy.arange(len(x))
+        for halving in range(30):
+            trial[0] = numpy.clip(trial[0], *logAlphaRange)
+            trial[1] = numpy.clip(trial[1], *logBetaRange)
+            # the rows of the cells still being halved, narrowed down rather
+            # than found afresh among all the rows
+            rows = rows[halve[cell[rows]]]
+            pTrial = _pAndDerivs(x[rows], trial[0][cell[rows]], trial[1][cell[rows]], function,
+                                 guess, lapse, False)
+            llTrial[halve] = _logLik(pTrial, k[rows], n[rows], cell[rows], nActive)[halve]
+            worse = llTrial < llActive
+            scale[worse] *= 0.5
+            # a cell gives up once even the halved step would gain less than tolerance
+            halve = worse & (scale*decrement >= tolerance)
+            if not halve.any():
+                break
+            trial[:, halve] = th[:, halve] + scale[halve]*step[:, halve]
+        accept = ~worse
+        theta[:, ids[accept]] = trial[:, accept]
+        ll[ids[accept]] = llTrial[accept]
+        # done when there's nothing left to gain, or no step helps at all
+        done = worse | (decrement < tolerance)
+        converged[ids[done]] = True
+        if done.all():
+            break
+        keep = ~done[cell]
+        remap = numpy.cumsum(~done) - 1
+        ids = ids[~done]
+        x, k, n, cell = x[keep], k[keep], n[keep], remap[cell[keep]]
+
+    return converged
+
+
+def fitCells(intensity, correct, cell, nCells=None, function='weibull', guess=0.5,
+             lapse=0.02, start=None, maxIter=100, tolerance=1e-7):
+    """fit every cell's psychometric function at once
+
+    intensity, correct (bool, or 1 for correct) and cell (0..nCells-1) have one
+    value per trial.  Each cell is fitted from its best point at each slope
+    on a grid, and keeps the fit with the highest likelihood; start, (alpha,
+    beta) arrays with a value per cell, skips the grid search and fits from
+    there alone (e.g. refitting resampled data from the original fit).
+    Returns a dict of arrays with one value per cell: alpha, beta, logLik,
+    nTrials and converged.
+    """
+    cell = numpy.asarray(cell, dtype=numpy.intp)
+    if nCells is None:
+        nCells = int(cell.max()) + 1 if cell.size else 0
+    cell, level, k, n, levels = _pool(numpy.asarray(intensity, dtype=float),
+                                      numpy.asarray(correct) == 1, cell)
+    x = levels[level]
+    nTrials = numpy.bincount(cell, n, minlength=nCells).astype(int)
+    positive = levels[levels > 0]
+    lo, hi = (positive.min(), levels.max()) if positive.size else (1e-3, 1.0)
+    # alpha may end up a little outside the intensities tested, but not far
+    logAlphaRange = (numpy.log(lo/10.0), numpy.log(hi*10.0))
+    if start is None:
+        # with few trials the likelihood can have several peaks, so every start
+        # is fitted, as a cell of its own (start j of cell c is cell
+        # j*nCells + c), until it is near its peak; only the best of each
+        # cell's is then fitted to the end
+        starts, llStarts = _gridStart(level, levels, k, n, cell, nCells, function, guess, lapse)
+        nStarts = starts.shape[2]
+        thetaStarts = starts.transpose(0, 2, 1).reshape(2, -1)
+        llStarts = llStarts.T.ravel()
+        _score(numpy.tile(x, nStarts), numpy.tile(k, nStarts), numpy.tile(n, nStarts),
+               (cell + nCells*numpy.arange(nStarts)[:, None]).ravel(), thetaStarts, llStarts,
+               function, guess, lapse, logAlphaRange, maxIter, screenTolerance)
+        pick = llStarts.reshape(nStarts, nCells).argmax(axis=0)*nCells + numpy.arange(nCells)
+        theta, ll = thetaStarts[:, pick], llStarts[pick]
+    else:
+        theta = numpy.log(numpy.array(start, dtype=float))
+        ll = _logLik(_pAndDerivs(x, theta[0][cell], theta[1][cell], function, guess, lapse, False),
+                     k, n, cell, nCells)
+    converged = _score(x, k, n, cell, theta, ll, function, guess, lapse, logAlphaRange,
+                       maxIter, tolerance)
+
+    return {'alpha': numpy.exp(theta[0]), 'beta': numpy.exp(theta[1]), 'logLik': ll,
+            'nTrials': nTrials, 'converged': converged}
+
+
+def bootstrapCells(intensity, correct, cell, nCells=None, nBoot=200, ci=95, rng=None,
+                   chunkTrials=2000000, **fitArgs):
+    """percentile bootstrap confidence intervals for every cell's alpha and beta
+
+    Each replicate resamples every cell's trials with replacement and refits,
+    starting from the fit to all the trials; replicates of all cells are
+    fitted together, as many per batch as fit in about chunkTrials trials.
+    Returns the fit to all the trials, with (nCells, 2) arrays of the lower
+    and upper limits added as alphaCI and betaCI.
+    """
+    rng = numpy.random.default_rng(rng)
+    x = numpy.asarray(intensity, dtype=float)
+    correct = numpy.asarray(correct) == 1
+    cell = numpy.asarray(cell, dtype=numpy.intp)
+    if nCells is None:
+        nCells = int(cell.max()) + 1 if cell.size else 0
+    # trials sorted by cell, so each cell's trials are a contiguous run to draw from
+    order = numpy.argsort(cell, kind='stable')
+    x, correct, cell = x[order], correct[order], cell[order]
+    counts = numpy.bincount(cell, minlength=nCells)
+    starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+
+    fit = fitCells(x, correct, cell, nCells, **fitArgs)
+
+    perBatch = max(1, chunkTrials//max(1, len(x)))
+    alphas, betas = [], []
+    for first in range(0, nBoot, perBatch):
+        nRep = min(perBatch, nBoot - first)
+        repCell = numpy.tile(cell, nRep)
+        picks = starts[repCell] + (rng.random(repCell.size)*counts[repCell]).astype(numpy.intp)
+        # replicate r of cell c is cell r*nCells + c of this batch
+        batchCell = repCell + nCells*numpy.repeat(numpy.arange(nRep), len(cell))
+        start = [numpy.tile(fit['alpha'], nRep), numpy.tile(fit['beta'], nRep)]
+        repFit = fitCells(x[picks], correct[picks], batchCell, nRep*nCells, start=start, **fitArgs)
+        alphas.append(repFit['alpha'].reshape(nRep, nCells))
+        betas.append(repFit['beta'].reshape(nRep, nCells))
+    limits = [(100 - ci)/2.0, 100 - (100 - ci)/2.0]
+    fit['alphaCI'] = numpy.percentile(numpy.concatenate(alphas), limits, axis=0).T
+    fit['betaCI'] = numpy.percentile(numpy.concatenate(betas), limits, axis=0).T
+    return fit
@@ -0,0 +1,39 @@
+"""keyboard responses timed from stimulus onset, using psychopy.hardware.keyboard
+
+The Keyboard class timestamps key presses where they are read (psychtoolbox or
+iohub backends timestamp them in the hardware event queue), so reaction times
+don't depend on how often the trial loop polls.
+"""
+from psychopy.hardware import keyboard
+
+
+class ResponseCollector(object):
+    """Waits for a response key and returns it with its RT from the onset flip"""
+
+    def __init__(self, win, keyList=('left', 'right', 'q', 'escape'), backend=None):
+        self.win = win
+        self.keyList = list(keyList)
+        if backend:
+            self.kb = keyboard.Keyboard(backend=backend)
+        else:
+            self.kb = keyboard.Keyboard()  # the best backend available
+
+    def armOnFlip(self):
+        """call just before the stimulus-onset flip
+
+        On that flip the RT clock is zeroed and keys pressed before onset are dropped.
+        """
+        self.win.callOnFlip(self.kb.clock.reset)
+        self.win.callOnFlip(self.kb.clearEvents)
+
+    def waitResponse(self, whileWaiting=None):
+        """(key name, RT in seconds) of the first key in keyList pressed since onset
+
+        whileWaiting is called first, so work for the next trial happens while
+        the participant is still deciding; key presses are timestamped anyway.
+        """
+        if whileWaiting is not None:
+            whileWaiting()
+        # waitRelease=False: the RT is the press, and we don't wait for the release either
+        keys = self.kb.waitKeys(keyList=self.keyList, waitRelease=False)
+        return keys[0].name, keys[0].rt
@@ -0,0 +1,250 @@
+"""block scheduler - the block conditions come from a conditions file and run through one trial loop"""
+from psychopy import data
+import numpy, random, re, zlib
+from psi import PsiHandler
+
+# the staircase settings every block must give
+stairKeys = ['startVal', 'stepSizes', 'nReversals', 'nUp', 'nDown', 'nTrials', 'minVal', 'maxVal']
+
+
+def parseSteps(stepSizes):
+    """step sizes may be written as '0.04 0.02 0.01' (or with commas/brackets) in the file"""
+    if isinstance(stepSizes, str):
+        return [float(s) for s in stepSizes.strip('[]').replace(',', ' ').split()]
+    if numpy.iterable(stepSizes):
+        return [float(s) for s in stepSizes]
+    return [float(stepSizes)]
+
+
+def loadBlocks(fileName='blocks.csv'):
+    """read one dict per block from a .csv/.xlsx conditions file"""
+    blocks = data.importConditions(fileName)
+    for block in blocks:
+        # (a vOffset in pixels is no longer read: positions come from lambdaMult, see geometry.py)
+        missing = [k for k in ['label', 'lambdaMult', 'nLoops'] + stairKeys
+                   if k not in block]
+        if missing:
+            raise ValueError('block %r in %s has no %s' % (block.get('label'), fileName,
+                                                          ', '.join(missing)))
+        block['stepSizes'] = parseSteps(block['stepSizes'])
+        block['nLoops'] = int(block['nLoops'])
+        block.setdefault('iti', 0)
+        block.setdefault('method', 'staircase')
+        if block['method'] not in ['staircase', 'psi']:
+            raise ValueError("block %r: method must be 'staircase' or 'psi'" % block['label'])
+        # what the staircase drives: the target's contrast, or its tilt (deg) either side of refOri
+        block.setdefault('mode', 'contrast')
+        block.setdefault('refOri', 0)
+        if block['mode'] not in ['contrast', 'orientation']:
+            raise ValueError("block %r: mode must be 'contrast' or 'orientation'" % block['label'])
+    return blocks
+
+
+def latinSquareRow(n, row):
+    """one row of a balanced (Williams) latin square of n blocks
+
+    Over n rows (2n when n is odd) every block appears in every position and
+    follows every other block equally often.
+    """
+    first = [0]
+    lo, hi = 1, n - 1
+    while len(first) < n:
+        first.append(lo)
+        lo += 1
+        if len(first) < n:
+            first.append(hi)
+            hi -= 1
+    order = [(i + row) % n for i in first]
+    if n % 2 and (row//n) % 2:
+        order.reverse()
+    return order
+
+
+def participantNumber(observer):
+    """the number an observer ID ends with (p007 -> 7), or None"""
+    match = re.search(r'(\d+)$', observer)
+    return int(match.group(1)) if match else None
+
+
+def orderBlocks(blocks, order='fixed', observer='', row=None):
+    """blocks in the order to run them: 'fixed', 'random' or 'counterbalanced'
+
+    A random order is seeded from the observer name, so a session restarted
+    with startBlock gets the same order again.  A counterbalanced order is
+    row row of the latin square (taken modulo its rows); by default that is
+    the number the observer ID ends with less one, so p001, p002... take the
+    rows in turn, and for an ID without a number a row seeded from the name.
+    """
+    seed = zlib.crc32(observer.encode('utf-8'))
+    if order == 'fixed':
+        indices = list(range(len(blocks)))
+    elif order == 'random':
+        indices = list(range(len(blocks)))
+        random.Random(seed).shuffle(indices)
+    elif order == 'counterbalanced':
+        nRows = len(blocks)*(1 + len(blocks) % 2)
+        if row is None:
+            number = participantNumber(observer)
+            row = seed if number is None else number - 1
+        indices = latinSquareRow(len(blocks), row % nRows)
+    else:
+        raise ValueError("block order must be 'fixed', 'random' or 'counterbalanced', not %r" % order)
+    return [blocks[i] for i in indices]
+
+
+def stairCondition(block, trialLoop):
+    """the block's settings for one loop, as a MultiStairHandler-style condition"""
+    condition = dict(block)
+    condition['trialLoop'] = trialLoop
+    condition['stepType'] = 'lin'
+    return condition
+
+
+def makeStaircase(block, trialLoop=0, **handlerArgs):
+    """the staircase handler for one loop of a block
+
+    A block whose method is 'psi' gets a PsiHandler running nTrials trials
+    between minVal and maxVal instead of a StairHandler.  handlerArgs go to
+    the handler as they are, e.g. originPath=-1 and autoLog=False to skip the
+    costly bookkeeping in simulated sessions.
+    """
+    if block.get('method') == 'psi':
+        staircase = PsiHandler(nTrials=block['nTrials'], minVal=block['minVal'],
+                               maxVal=block['maxVal'], extraInfo={'label': block['label']},
+                               **handlerArgs)
+        staircase.condition = stairCondition(block, trialLoop)
+        return staircase
+    staircase = data.StairHandler(startVal=block['startVal'],
+                                  nReversals=block['nReversals'],
+                                  stepType='lin', stepSizes=block['stepSizes'],
+                                  minVal=block['minVal'], maxVal=block['maxVal'],
+                                  nUp=block['nUp'], nDown=block['nDown'],
+                                  nTrials=block['nTrials'],
+                                  extraInfo={'label': block['label']}, **handlerArgs)
+    # as MultiStairHandler does, so both modes carry their condition the same way
+    staircase.condition = stairCondition(block, trialLoop)
+    return staircase
+
+
+class InterleavedStairs(object):
+    """A MultiStairHandler over every loop of every block, iterated like a StairHandler
+
+    Each next() picks a staircase (method 'random', 'fullRandom' or
+    'sequential', i.e. round-robin) and sets .condition to its block settings.
+    """
+
+    def __init__(self, blocks, method='random', **handlerArgs):
+        if [block for block in blocks if block.get('method') == 'psi']:
+            raise ValueError('psi blocks can only be run blocked, not interleaved')
+        conditions = [stairCondition(block, trialLoop) for block in blocks
+                      for trialLoop in range(block['nLoops'])]
+        for condition in conditions:
+            condition.update(handlerArgs)  # MultiStairHandler passes these on to each StairHandler
+        self.stairs = data.MultiStairHandler(stairType='simple', method=method,
+                                             conditions=conditions, **handlerArgs)
+        self.condition = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        thisIncrement, self.condition = next(self.stairs)
+        return thisIncrement
+
+    next = __next__
+
+    def addData(self, result):
+        self.stairs.addResponse(result)
+
+    @property
+    def staircases(self):
+        return self.stairs.staircases
+
+    @property
+    def currentStaircase(self):
+        return self.stairs.currentStaircase
+
+    @property
+    def finished(self):
+        return self.stairs.finished
+
+
+def approxThreshold(staircase, nReversals=4):
+    """mean of the final nReversals reversal intensities (posterior mean for a PsiHandler)"""
+    if isinstance(staircase, PsiHandler):
+        return staircase.estimate()[0]
+    return numpy.average(staircase.reversalIntensities[-nReversals:])
+
+
+def isReversal(staircase):
+    """whether the response just added made the staircase reverse"""
+    staircase = getattr(staircase, 'currentStaircase', staircase)
+    return bool(staircase.reversalPoints) and staircase.reversalPoints[-1] == staircase.thisTrialN
+
+
+def feedbackText(staircase, nReversals=4):
+    """the end-of-loop feedback for a StairHandler or InterleavedStairs"""
+    lines = []
+    for s in getattr(staircase, 'staircases', [staircase]):
+        if isinstance(s, PsiHandler):
+            lines.append('%s: threshold estimate = %.3f' % (s.condition['label'], approxThreshold(s)))
+        else:
+            lines.append('%s: mean of final %i reversals = %.3f'
+                         % (s.condition['label'], nReversals, approxThreshold(s, nReversals)))
+    return '\n'.join(lines)
+
+
+class BlockScheduler(object):
+    """Runs the blocks of a session in order, one staircase per loop of each block
+
+    Every staircase handler is built up front so nothing is constructed
+    between trials.  Iterate over loops() to get (block, trialLoop, staircase).
+
+    With interleave set to a MultiStairHandler method ('random', 'fullRandom'
+    or 'sequential') all the staircases run together instead, as a single
+    loop with block None; each trial's settings are then in staircase.condition.
+    """
+
+    def __init__(self, blocks, order='fixed', observer='', startBlock=1,
+                 interleave='blocked', orderRow=None, **handlerArgs):
+        self.blocks = [dict(block) for block in orderBlocks(blocks, order, observer, orderRow)]
+        for blockN, block in enumerate(self.blocks):
+            block['blockN'] = blockN
+        self.startBlock = startBlock  # 1-based, to resume a session at a block
+        if not 1 <= startBlock <= len(self.blocks):
+            raise ValueError('startBlock must be between 1 and %i' % len(self.blocks))
+        self.interleave = interleave
+        if interleave == 'blocked':
+            self.staircases = [[makeStaircase(block, trialLoop, **handlerArgs)
+                                for trialLoop in range(block['nLoops'])]
+                               for block in self.blocks]
+        else:
+            self.staircases = InterleavedStairs(self.blocks, method=interleave, **handlerArgs)
+        self.blockN = None
+        self.trialLoop = None
+
+    def loops(self):
+        """(block, trialLoop, staircase) for every loop still to run
+
+        A scheduler restored from a checkpoint carries on from the loop it had
+        reached, skipping any staircase that has already finished.
+        """
+        if self.interleave != 'blocked':
+            self.blockN = self.trialLoop = 0
+            if not self.staircases.finished:
+                yield None, 0, self.staircases
+            return
+        if self.blockN is None:
+            firstBlock, firstLoop = self.startBlock - 1, 0
+        else:  # resumed
+            firstBlock, firstLoop = self.blockN, self.trialLoop
+        for blockN in range(firstBlock, len(self.blocks)):
+            self.blockN = blockN
+            block = self.blocks[blockN]
+            for trialLoop, staircase in enumerate(self.staircases[blockN]):
+                if blockN == firstBlock and trialLoop < firstLoop:
+                    continue
+                if getattr(staircase, 'finished', False):
+                    continue
+                self.trialLoop = trialLoop
+                yield block, trialLoop, staircase
@@ -0,0 +1,85 @@
+"""simulated observer - responses drawn from a psychometric function instead of the keyboard"""
+import math, numpy, random
+
+
+def weibull(x, alpha, beta, guess=0.5, lapse=0.0):
+    """probability correct; alpha is the threshold and beta the slope"""
+    x = numpy.maximum(x, 0.0)
+    return guess + (1.0 - guess - lapse)*(1.0 - numpy.exp(-(x/alpha)**beta))
+
+
+def logistic(x, alpha, beta, guess=0.5, lapse=0.0):
+    """probability correct; alpha is the midpoint and beta the slope"""
+    return guess + (1.0 - guess - lapse)/(1.0 + numpy.exp(-beta*(x - alpha)))
+
+
+def weibullInverse(p, alpha, beta, guess=0.5, lapse=0.0):
+    """the intensity at which weibull() gives p"""
+    f = (p - guess)/(1.0 - guess - lapse)
+    return alpha*(-numpy.log(1.0 - f))**(1.0/beta)
+
+
+def logisticInverse(p, alpha, beta, guess=0.5, lapse=0.0):
+    """the intensity at which logistic() gives p"""
+    f = (p - guess)/(1.0 - guess - lapse)
+    return alpha - numpy.log(1.0/f - 1.0)/beta
+
+
+functions = {'weibull': (weibull, weibullInverse),
+             'logistic': (logistic, logisticInverse)}
+
+
+class SimulatedObserver(object):
+    """A 2AFC observer whose chance of a correct response follows a psychometric function
+
+    threshold can be a dict of block label: threshold, to simulate crowding
+    that changes with flanker distance.  guess is 0.5 for the left/right task.
+    """
+
+    def __init__(self, threshold=0.3, slope=3.5, function='weibull',
+                 guess=0.5, lapse=0.02, seed=None):
+        if function not in functions:
+            raise ValueError('function must be one of %s' % ', '.join(sorted(functions)))
+        self.threshold = threshold
+        self.slope = slope
+        self.function = function
+        self.guess = guess
+        self.lapse = lapse
+        self.rng = random.Random(seed)  # plain random is faster than numpy per trial
+
+    def thresholdFor(self, label=None):
+        if isinstance(self.threshold, dict):
+            return self.threshold[label]
+        return self.threshold
+
+    def pCorrect(self, intensity, label=None):
+        func = functions[self.function][0]
+        return func(intensity, self.thresholdFor(label), self.slope, self.guess, self.lapse)
+
+    def intensityFor(self, p, label=None):
+        """the true intensity giving p correct, e.g. what a staircase should converge on"""
+        inverse = functions[self.function][1]
+        return inverse(p, self.thresholdFor(label), self.slope, self.guess, self.lapse)
+
+    def respond(self, intensity, label=None):
+        """1 (correct) or -1 (incorrect), as the trial loop scores key presses"""
+        # pCorrect() written out with math: numpy is slow on one value at a time
+        alpha = self.thresholdFor(label)
+        if self.function == 'weibull':
+            f = 1.0 - math.exp(-(max(intensity, 0.0)/alpha)**self.slope)
+        else:
+            f = 1.0/(1.0 + math.exp(min(-self.slope*(intensity - alpha), 700.0)))
+        if self.rng.random() < self.guess + (1.0 - self.guess - self.lapse)*f:
+            return 1
+        return -1
+
+
+def runSession(scheduler, observer):
+    """the Staircase4.py trial loop with no window: the observer answers every trial
+
+    Returns the finished scheduler, whose staircases hold the simulated data.
+    """
+    for block, trialLoop, staircase in scheduler.loops():
+        for thisIncrement in staircase:
+            staircase.addData(observer.respond(thisIncrement, staircase.condition['label']))
+    return scheduler
@@ -0,0 +1,71 @@
+"""run the Staircase4.py staircases against a simulated observer, headless and fast
+
+e.g.  python simulate.py -n 5000 --threshold 0.3 --slope 3.5 --lapse 0.02
+"""
+import argparse, multiprocessing, time
+import numpy
+from scheduler import BlockScheduler, loadBlocks, approxThreshold
+from simobserver import SimulatedObserver, runSession
+
+
+def simulateSessions(blocks, nSessions, observerArgs, interleave='blocked', seed=0):
+    """thresholds from nSessions simulated sessions, as {label: [threshold, ...]}"""
+    observer = SimulatedObserver(seed=seed, **observerArgs)
+    thresholds = {}
+    for sessionN in range(nSessions):
+        # no origin file or logging: those dominate the cost of building a StairHandler
+        scheduler = BlockScheduler(blocks, interleave=interleave, originPath=-1, autoLog=False)
+        runSession(scheduler, observer)
+        staircases = getattr(scheduler.staircases, 'staircases', None)
+        if staircases is None:
+            staircases = [s for loops in scheduler.staircases for s in loops]
+        for staircase in staircases:
+            label = staircase.condition['label']
+            thresholds.setdefault(label, []).append(approxThreshold(staircase))
+    return thresholds
+
+
+def _simulateChunk(args):
+    return simulateSessions(*args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--sessions', type=int, default=1000)
+    parser.add_argument('--blocks', default='blocks.csv')
+    parser.add_argument('--interleave', default='blocked',
+                        help='blocked, random, fullRandom or sequential')
+    parser.add_argument('--function', default='weibull', help='weibull or logistic')
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--slope', type=float, default=3.5)
+    parser.add_argument('--lapse', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--processes', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    blocks = loadBlocks(args.blocks)
+    observerArgs = {'threshold': args.threshold, 'slope': args.slope,
+                    'function': args.function, 'lapse': args.lapse}
+    # split the sessions evenly over the processes, each with its own seed
+    nProcesses = max(1, min(args.processes, args.sessions))
+    chunks = [(blocks, len(range(n, args.sessions, nProcesses)), observerArgs,
+               args.interleave, args.seed + n) for n in range(nProcesses)]
+    t0 = time.time()
+    if nProcesses == 1:
+        results = [_simulateChunk(chunks[0])]
+    else:
+        pool = multiprocessing.Pool(nProcesses)
+        results = pool.map(_simulateChunk, chunks)
+        pool.close()
+    elapsed = time.time() - t0
+
+    nDown = blocks[0]['nDown']
+    target = SimulatedObserver(**observerArgs).intensityFor(0.5**(1.0/nDown))
+    print('%i sessions in %.2f s (%.0f sessions/s)'
+          % (args.sessions, elapsed, args.sessions/elapsed))
+    print('true %.1f%% point = %.4f' % (100*0.5**(1.0/nDown), target))
+    for block in blocks:
+        values = numpy.concatenate([r[block['label']] for r in results])
+        print('%-10s mean threshold = %.4f  bias = %+.4f  SD = %.4f'
+              % (block['label'], numpy.nanmean(values), numpy.nanmean(values) - target,
+                 numpy.nanstd(values)))
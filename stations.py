@@ -0,0 +1,252 @@
+"""run a session on every testing station at once, with their data gathered in one place
+
+The coordinator starts one Staircase4.py per station as a subprocess, with
+no dialog, an observer ID of its own and the station's settings (any of the
+launch.py fields) from a stations file:
+
+    station,monitor,sfDeg,blockOrder,display
+    A,lab1,1.5,counterbalanced,:0.0
+    B,lab2,1.5,counterbalanced,:0.1
+
+(display, if given, is the station's X display.)  Anything not given is the
+script's default: sessions started here neither read nor write
+lastParams.pickle.  Each session reports its start, every trial and its end
+to the coordinator as JSON lines over a local socket, from a background
+thread so the trial loop never waits on it.  The coordinator appends the
+trials to a .jsonl per session in the store as they arrive, copies the
+session's files there when it ends, and prints every station's progress as
+it goes.
+
+e.g.  python stations.py stations.csv --store central/ --prefix p
+"""
+import argparse, atexit, csv, json, os, queue, shutil, socket, subprocess, sys, threading, time
+import launch
+
+envAddress = 'FLANKER_COORDINATOR'  # host:port of the coordinator, set for every session
+envStation = 'FLANKER_STATION'
+observersFile = 'observers.txt'  # every observer ID assigned so far, in the store
+
+
+def _jsonDefault(value):
+    # numpy scalars from the staircases
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class Reporter(object):
+    """Sends a session's events to the coordinator as JSON lines, from a background thread
+
+    send() only queues the event; if the coordinator goes away the events are
+    dropped and the session carries on.
+    """
+
+    def __init__(self, address, station):
+        self.station = station
+        self.error = None
+        self.queue = queue.Queue()
+        self.sock = socket.create_connection(address, timeout=5)
+        self.thread = threading.Thread(target=self._run, name='Reporter')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+            if self.error is not None:
+                continue  # the coordinator is gone, nothing more can be sent
+            try:
+                self.sock.sendall((json.dumps(event, default=_jsonDefault) + '\n').encode('utf-8'))
+            except (OSError, ValueError) as e:
+                self.error = e
+        self.sock.close()
+
+    def send(self, event, **values):
+        values.update(event=event, station=self.station, time=time.time())
+        self.queue.put(values)
+
+    def close(self):
+        """send whatever is queued and disconnect"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(5)
+
+
+def reporterFromEnv(environ=None):
+    """the Reporter for a session started by the coordinator, None for any other session"""
+    environ = os.environ if environ is None else environ
+    if envAddress not in environ:
+        return None
+    host, port = environ[envAddress].rsplit(':', 1)
+    return Reporter((host, int(port)), environ.get(envStation, ''))
+
+
+def loadStations(fileName):
+    """one dict of settings per station, from a CSV with a station column"""
+    with open(fileName, newline='') as f:
+        stations = [dict((key, value) for key, value in row.items() if value not in (None, ''))
+                    for row in csv.DictReader(f)]
+    names = [station.get('station') for station in stations]
+    if None in names or len(set(names)) < len(names):
+        raise ValueError('every station in %s needs a station name of its own' % fileName)
+    return stations
+
+
+def assignObservers(store, n, prefix='p'):
+    """n new observer IDs, numbered on from those already assigned in this store
+
+    The numbers also pick each observer's counterbalanced block order (see
+    scheduler.orderBlocks), so consecutive IDs take the latin square rows in turn.
+    """
+    fileName = os.path.join(store, observersFile)
+    used = []
+    if os.path.exists(fileName):
+        with open(fileName) as f:
+            used = [line.strip() for line in f if line.strip()]
+    numbers = [int(observer[len(prefix):]) for observer in used
+               if observer.startswith(prefix) and observer[len(prefix):].isdigit()]
+    first = max(numbers) + 1 if numbers else 1
+    observers = ['%s%03i' % (prefix, first + i) for i in range(n)]
+    with open(fileName, 'a') as f:
+        f.writelines(observer + '\n' for observer in observers)
+    return observers
+
+
+class Coordinator(object):
+    """Starts a session per station and collects what they report into store"""
+
+    def __init__(self, store, script='Staircase4.py', host='127.0.0.1', port=0):
+        self.store = store
+        self.script = os.path.abspath(script)
+        if not os.path.isdir(store):
+            os.makedirs(store)
+        self.events = queue.Queue()
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        self.sessions = {}  # station: {'process', 'observer', 'status', ...}
+        thread = threading.Thread(target=self._accept, name='accept')
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except OSError:
+                return  # closed
+            thread = threading.Thread(target=self._read, args=(connection,), name='read')
+            thread.daemon = True
+            thread.start()
+
+    def _read(self, connection):
+        with connection, connection.makefile('r', encoding='utf-8') as lines:
+            for line in lines:
+                try:
+                    self.events.put(json.loads(line))
+                except ValueError:
+                    pass  # a line cut short by a crash
+
+    def launch(self, station, observer):
+        """start the station's session as observer"""
+        name = station['station']
+        args = [sys.executable, self.script, '--no-dialog', '--observer', observer]
+        convert = dict(launch.fields)
+        for key, value in station.items():
+            if key in launch.flags:
+                if convert[key](value):  # e.g. resume: --resume for 1/true/yes, nothing otherwise
+                    args.append('--' + key)
+            elif key not in ['station', 'display', 'observer']:
+                args += ['--' + key, value]
+        env = dict(os.environ)
+        env[envAddress] = '%s:%i' % self.address
+        env[envStation] = name
+        # the station's settings and the defaults only, never another session's lastParams.pickle
+        env[launch.envPrefix + 'LASTPARAMS'] = '0'
+        if 'display' in station:
+            env['DISPLAY'] = station['display']
+        log = open(os.path.join(self.store, '%s_%s.log' % (name, observer)), 'w')
+        process = subprocess.Popen(args, env=env, cwd=os.path.dirname(self.script),
+                                   stdout=log, stderr=subprocess.STDOUT)
+        log.close()  # the session has its own copy
+        self.sessions[name] = {'process': process, 'observer': observer, 'status': 'starting',
+                               'trials': 0, 'block': None, 'nBlocks': None, 'label': '',
+                               'sessionName': None, 'started': time.time()}
+
+    def handle(self, event):
+        session = self.sessions.get(event.get('station'))
+        if session is None:
+            return
+        if event['event'] == 'start':
+            session.update(status='running', nBlocks=event.get('nBlocks'),
+                           sessionName=os.path.basename(event['fileName']))
+        elif event['event'] == 'trial':
+            session['trials'] += 1
+            session['block'] = event.get('blockN')
+            session['label'] = event.get('staircase', '')
+            if session['sessionName'] is not None:
+                # every trial in the store as it happens, in case the station's disk is lost
+                with open(os.path.join(self.store, session['sessionName'] + '.jsonl'), 'a') as f:
+                    f.write(json.dumps(event) + '\n')
+        elif event['event'] == 'end':
+            for fileName in event.get('files', []):
+                if os.path.exists(fileName):
+                    shutil.copy2(fileName, self.store)
+            session['status'] = 'done'
+
+    def progress(self):
+        """one line with every station's state"""
+        parts = []
+        for name, session in sorted(self.sessions.items()):
+            if session['status'] == 'running' and session['block'] is not None:
+                state = 'block %i/%s %s, %i trials' % (session['block'] + 1, session['nBlocks'],
+                                                        session['label'], session['trials'])
+            else:
+                state = '%s, %i trials' % (session['status'], session['trials'])
+            parts.append('%s %s: %s' % (name, session['observer'], state))
+        return ' | '.join(parts)
+
+    def run(self, interval=2.0):
+        """handle events until every session has exited, printing progress every interval s"""
+        nextReport = time.time()
+        while True:
+            running = False
+            for session in self.sessions.values():
+                returnCode = session['process'].poll()
+                if returnCode is None:
+                    running = True
+                elif session['status'] != 'done':
+                    session['status'] = 'exited %i' % returnCode
+            # whatever arrives over the next 0.2 s (when nothing is running, until it stops arriving)
+            deadline = time.time() + 0.2
+            try:
+                while time.time() < deadline or not running:
+                    self.handle(self.events.get(timeout=0.2))
+            except queue.Empty:
+                pass
+            if time.time() >= nextReport or not running:
+                print(self.progress())
+                nextReport = time.time() + interval
+            if not running:
+                break
+        self.server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('stations', help='CSV of station settings')
+    parser.add_argument('--store', default='central')
+    parser.add_argument('--observers', nargs='+', help='one per station, in order; assigned if not given')
+    parser.add_argument('--prefix', default='p', help='of the assigned observer IDs')
+    parser.add_argument('--script', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'Staircase4.py'))
+    args = parser.parse_args()
+
+    stations = loadStations(args.stations)
+    coordinator = Coordinator(args.store, args.script)
+    observers = args.observers or assignObservers(args.store, len(stations), args.prefix)
+    if len(observers) != len(stations):
+        parser.error('%i observers for %i stations' % (len(observers), len(stations)))
+    for station, observer in zip(stations, observers):
+        coordinator.launch(station, observer)
+    coordinator.run()
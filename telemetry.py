@@ -0,0 +1,112 @@
+"""per-trial timing spans - how long each phase of a trial took, kept in a ring buffer
+
+Spans are timed with the monotonic perf_counter and chained, so timing a
+phase is one clock read and a few array stores:
+
+    t = telemetry.start()
+    ...set up the trial...
+    t = telemetry.stop('setup', t)
+    ...wait for the response...
+    t = telemetry.stop('response', t)
+
+The buffer is preallocated and the oldest spans are overwritten once it has
+capacity of them; flush() appends the spans recorded since the last flush to a
+sidecar CSV (at block boundaries, say), and summary() gives percentiles per
+phase, so a timing regression after a hardware or psychopy change shows up
+by comparing sessions.
+"""
+import csv, os, time
+import numpy
+
+fields = ['trial', 'phase', 'start', 'ms']
+
+
+class Telemetry(object):
+    """Spans of (trial, phase, start, duration) in preallocated arrays"""
+
+    def __init__(self, fileName=None, capacity=1 << 16):
+        self.fileName = fileName  # the sidecar CSV, appended to by flush()
+        self.capacity = capacity
+        self.trials = numpy.zeros(capacity, numpy.int32)
+        self.phaseCodes = numpy.zeros(capacity, numpy.int16)
+        self.starts = numpy.zeros(capacity, numpy.float64)
+        self.durations = numpy.zeros(capacity, numpy.float64)
+        self.phases = []  # names, by phase code
+        self.codes = {}
+        self.trialN = 0  # set by the trial loop, stored with every span
+        self.n = 0  # spans recorded
+        self.nFlushed = 0
+        self.t0 = time.perf_counter()
+
+    def start(self):
+        return time.perf_counter()
+
+    def record(self, phase, duration, start=None):
+        """store one span of duration seconds, starting at perf_counter time start
+
+        start is None for spans timed on another clock (e.g. frame intervals
+        from the flip times), which are stored with a NaN start.
+        """
+        code = self.codes.get(phase)
+        if code is None:
+            code = self.codes[phase] = len(self.phases)
+            self.phases.append(phase)
+        i = self.n % self.capacity
+        self.trials[i] = self.trialN
+        self.phaseCodes[i] = code
+        self.starts[i] = numpy.nan if start is None else start - self.t0
+        self.durations[i] = duration
+        self.n += 1
+
+    def stop(self, phase, start):
+        """record the span from start until now; returns now, the start of the next one"""
+        now = time.perf_counter()
+        self.record(phase, now - start, start)
+        return now
+
+    def _indices(self, first):
+        # buffer positions of spans first..n-1, those not yet overwritten
+        first = max(first, self.n - self.capacity)
+        return numpy.arange(first, self.n) % self.capacity
+
+    def flush(self):
+        """append the spans since the last flush to the sidecar; returns how many were lost
+
+        Spans overwritten before they were flushed are lost, which only happens
+        with more than capacity of them between flushes.
+        """
+        lost = max(0, self.n - self.capacity - self.nFlushed)
+        indices = self._indices(self.nFlushed)
+        self.nFlushed = self.n
+        if self.fileName is None or not len(indices):
+            return lost
+        newFile = not os.path.exists(self.fileName) or os.path.getsize(self.fileName) == 0
+        with open(self.fileName, 'a', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            if newFile:
+                writer.writerow(fields)
+            writer.writerows(zip(self.trials[indices].tolist(),
+                                 [self.phases[c] for c in self.phaseCodes[indices]],
+                                 ['%.6f' % s for s in self.starts[indices]],
+                                 ['%.4f' % (1000*d) for d in self.durations[indices]]))
+        return lost
+
+    def percentiles(self, q=(50, 95, 99, 100)):
+        """{phase: (n, ms at each percentile in q)} over the spans still in the buffer"""
+        indices = self._indices(0)
+        codes = self.phaseCodes[indices]
+        durations = 1000*self.durations[indices]
+        result = {}
+        for code, phase in enumerate(self.phases):
+            phaseDurations = durations[codes == code]
+            if len(phaseDurations):
+                result[phase] = (len(phaseDurations), numpy.percentile(phaseDurations, q))
+        return result
+
+    def summary(self):
+        """one line per phase: median, 95th and 99th percentiles and max, in ms"""
+        lines = []
+        for phase, (n, (median, p95, p99, most)) in self.percentiles().items():
+            lines.append('%-14s %6i spans: median %8.3f ms, 95%% %8.3f ms, 99%% %8.3f ms, max %8.3f ms'
+                         % (phase, n, median, p95, p99, most))
+        return '\n'.join(lines)
@@ -0,0 +1,4 @@
+import os, sys
+
+# the modules are scripts at the top of the repo, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,23 @@
+import csv, os
+import pytest
+
+import analyze
+
+fixtures = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+
+def test_legacy_session_thresholds():
+    """every loop of a 2015 session, against the thresholds the original analysis gave"""
+    with open(os.path.join(fixtures, 'legacy_expected.csv'), newline='') as f:
+        expected = dict(((float(row['FlankerDist']), int(row['trialLoop'])),
+                         (int(row['nTrials']), float(row['threshold'])))
+                        for row in csv.DictReader(f))
+    # no block rules: the legacy blocks are all 1-up 3-down staircases
+    loops = analyze.analyzeFile((os.path.join(fixtures, 'legacy2015_Mar_03_1200.csv'), {}, 4))['loops']
+    got = dict(((loop['FlankerDist'], loop['trialLoop']), (loop['nTrials'], loop['threshold']))
+               for loop in loops)
+    assert sorted(got) == sorted(expected)
+    for key, (nTrials, threshold) in expected.items():
+        assert got[key][0] == nTrials
+        # expected to 4 decimals, rounded half up (0.35125 is 0.3513)
+        assert got[key][1] == pytest.approx(threshold, abs=0.5e-4 + 1e-9)
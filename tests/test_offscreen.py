@@ -0,0 +1,50 @@
+import numpy, pytest
+
+import offscreen
+from flankercache import FlankerCache
+from gaborbank import GaborBank
+from geometry import pixelLayout
+
+
+def centre(frame, rows, cols):
+    """the (x, y) pix centre of the contrast in frame[rows, cols], origin mid-window and y up"""
+    height, width = frame.shape
+    weights = numpy.abs(frame[rows, cols])
+    r, c = numpy.mgrid[rows, cols]
+    x = (weights*(c + 0.5)).sum()/weights.sum() - width/2.0
+    y = height/2.0 - (weights*(r + 0.5)).sum()/weights.sum()
+    return x, y
+
+
+# at 1.5 lambdas the flankers overlap, so their centres can't be told apart
+@pytest.mark.parametrize('lambdaMult', [3, 6, 12])
+@pytest.mark.parametrize('targetSide', [-1, 1])
+def test_cached_flankers_are_at_the_layout_offsets(lambdaMult, targetSide):
+    layout = pixelLayout(lambdaMults=offscreen.lambdaMults)
+    win = offscreen.Window(layout.windowSize)
+    bank = GaborBank(128)
+    maskers, target, fixation = offscreen.stimuli(win, bank, (bank.sfs[0], bank.oris[0]),
+                                                  layout.size)
+    cache = FlankerCache(win, maskers, layout.hOffset, bank=bank,
+                         imageStim=offscreen.BufferImageStim)
+    cache.get(layout.vOffset(lambdaMult), targetSide, 0.5).draw()
+    win.flip()
+    frame = win.getFrame()
+    height, width = frame.shape
+    top, bottom = slice(0, height//2), slice(height//2, height)
+    left, right = slice(0, width//2), slice(width//2, width)
+    vOffset = layout.vOffset(lambdaMult)
+    for rows, y in [(top, vOffset), (bottom, -vOffset)]:
+        for cols, x in [(left, -layout.hOffset), (right, layout.hOffset)]:
+            assert centre(frame, rows, cols) == pytest.approx((x, y), abs=1)
+
+
+def test_direct_and_cached_draw_the_same_frame():
+    frames = []
+    for strategy in ['cached', 'direct']:
+        win, presenter, drawArray = offscreen.benchmark(strategy, nTrials=5)
+        drawArray()
+        win.flip()
+        frames.append(win.getFrame())
+    assert numpy.abs(frames[0]).max() > 0
+    numpy.testing.assert_allclose(frames[0], frames[1], atol=1e-5)
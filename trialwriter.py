@@ -0,0 +1,135 @@
+"""background trial writer - rows are appended to the session CSV off the trial loop"""
+import atexit, csv, os, queue, threading, warnings
+
+_SYNC, _STOP = 'sync', 'stop'
+
+
+class TrialWriter(object):
+    """Appends trial rows to a CSV journal on a background thread
+
+    write() only checks and queues the row; the thread appends whatever has
+    queued up in one batch and flushes it.  sync() waits for the queue to drain
+    and fsyncs the file, so call it at block boundaries.  Rows are dicts and are
+    always written in the column order given by fields.  The file is opened for
+    appending and closed at exit, so core.quit() or a crash in the trial loop
+    still leaves every queued row on disk.
+
+    keepRows resumes a session from a checkpoint: rows beyond the first
+    keepRows, written after the checkpoint was taken, are dropped so they
+    aren't in the file twice, and rows the checkpoint had queued but that
+    never reached the file (unwritten, from unwritten() at the time) are
+    appended again.
+    """
+
+    def __init__(self, fileName, fields, keepRows=None, unwritten=()):
+        self.fileName = fileName
+        self.fields = list(fields)
+        newFile = not os.path.exists(fileName) or os.path.getsize(fileName) == 0
+        missing = []
+        if keepRows is not None and not newFile:
+            missing = self._truncate(keepRows, list(unwritten))
+        self.file = open(fileName, 'a', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fields, lineterminator='\n')
+        if newFile:
+            self.writer.writeheader()
+        self.writer.writerows(missing)
+        self.file.flush()
+        self.nRows = keepRows or 0
+        # rows queued but not yet on disk, oldest first, for checkpoints
+        self.pending = []
+        self.pendingLock = threading.Lock()
+        self.error = None
+        self.closed = False
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='TrialWriter')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _truncate(self, keepRows, unwritten):
+        """cut the file to keepRows rows; returns the rows it is short of, to append"""
+        with open(self.fileName, newline='') as f:
+            lines = f.readlines()
+        nRows = len(lines) - 1  # after the header
+        if nRows < keepRows:
+            nMissing = keepRows - nRows
+            if nMissing > len(unwritten):
+                warnings.warn('%s has %i rows, the checkpoint expected %i; %i were lost'
+                              % (self.fileName, nRows, keepRows, nMissing - len(unwritten)))
+            return unwritten[-nMissing:]
+        elif nRows > keepRows:
+            tmpName = '%s.%i.tmp' % (self.fileName, os.getpid())
+            with open(tmpName, 'w', newline='') as f:
+                f.writelines(lines[:keepRows + 1])
+            os.replace(tmpName, self.fileName)
+        return []
+
+    def write(self, row):
+        """queue one row (a dict keyed by the column names)"""
+        unknown = [k for k in row if k not in self.fields]
+        if unknown:
+            raise ValueError('%s has no column(s) %s' % (self.fileName, ', '.join(unknown)))
+        self.nRows += 1
+        with self.pendingLock:
+            self.pending.append(row)
+        self.queue.put(row)
+
+    def unwritten(self):
+        """the rows written so far that may not be in the file yet, oldest first"""
+        with self.pendingLock:
+            return list(self.pending)
+
+    def sync(self):
+        """block until every queued row is on disk"""
+        self._waitFor(_SYNC)
+
+    def close(self):
+        if self.closed:
+            return
+        self._waitFor(_STOP)
+        self.thread.join()
+        self.file.close()
+        self.closed = True
+
+    def _waitFor(self, command):
+        done = threading.Event()
+        self.queue.put((command, done))
+        done.wait()
+        if self.error is not None:
+            raise IOError('writing %s failed: %s' % (self.fileName, self.error))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            # take everything else already waiting so it goes out in one write
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            nWritten = 0
+            for item in batch:
+                if isinstance(item, tuple):
+                    command, done = item
+                    try:
+                        self.file.flush()
+                        os.fsync(self.file.fileno())
+                    except (IOError, OSError) as err:
+                        self.error = err
+                    done.set()
+                    if command == _STOP:
+                        return
+                elif self.error is None:
+                    try:
+                        self.writer.writerow(item)
+                        nWritten += 1
+                    except (IOError, OSError) as err:
+                        self.error = err
+            if self.error is None:
+                try:
+                    self.file.flush()
+                except (IOError, OSError) as err:
+                    self.error = err
+            if self.error is None:
+                with self.pendingLock:
+                    del self.pending[:nWritten]